@@ -1,13 +1,12 @@
-from datetime import datetime, timedelta, timezone
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Body
 from pydantic import BaseModel, EmailStr
-from jose import JWTError
+from jwt import InvalidTokenError
 from uuid import uuid4
 
-from app.core.database import pg_cursor
+from app.core.database import pg_cursor, execute_prepared
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password, create_access_token, create_refresh_token, decode_token, get_current_user
+from app.core.security import REFRESH_TOKEN_EXPIRE_DAYS, get_password_hash, verify_password, password_needs_rehash, create_access_token, create_refresh_token, decode_token, get_current_user, invalidate_cached_identity
 
 router = APIRouter()
 
@@ -38,13 +37,15 @@ class LoginRequest(BaseModel):
 
 
 @router.post("/register", response_model=MeResponse)
-async def register(payload: RegisterRequest):
+def register(payload: RegisterRequest):
+    # Hash before taking a connection and the lock; Argon2 is deliberately slow
+    hashed = get_password_hash(payload.password)
     # If first user, make admin; else default 'user'
-    with pg_cursor(commit=True) as cur:
-        cur.execute("SELECT COUNT(*) FROM users")
-        total_users = cur.fetchone()[0]
-        role = "admin" if total_users == 0 else "user"
-        hashed = get_password_hash(payload.password)
+    with pg_cursor(commit=True, dict_rows=True) as cur:
+        # Serialize the first-user check so two concurrent registrations can't both become admin
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('first_user'))")
+        execute_prepared(cur, "any_user_exists")
+        role = "user" if cur.fetchone()["has_users"] else "admin"
         cur.execute(
             """
             INSERT INTO users (username, email, hashed_password, full_name, role)
@@ -53,15 +54,15 @@ async def register(payload: RegisterRequest):
             """,
             (payload.username, payload.email, hashed, payload.full_name, role),
         )
-        row = cur.fetchone()
-        return MeResponse(id=row[0], username=row[1], email=row[2], full_name=row[3], role=row[4], is_active=row[5])
+        # Trusted RETURNING row: skip re-validating it
+        return MeResponse.model_construct(**cur.fetchone())
 
 
 @router.post("/login", response_model=TokenResponse)
-async def login(payload: LoginRequest):
+def login(payload: LoginRequest):
     # Authenticate by username
     with pg_cursor() as cur:
-        cur.execute("SELECT id, username, hashed_password, role, is_active FROM users WHERE username = %s", (payload.username,))
+        execute_prepared(cur, "user_by_username", (payload.username,))
         row = cur.fetchone()
     if not row:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect username or password")
@@ -70,6 +71,13 @@ async def login(payload: LoginRequest):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is blocked")
     if not verify_password(payload.password, hashed_password):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect username or password")
+    if password_needs_rehash(hashed_password):
+        # Opportunistically upgrade legacy hashes now that we have the plain password
+        with pg_cursor(commit=True) as cur:
+            cur.execute(
+                "UPDATE users SET hashed_password = %s WHERE id = %s",
+                (get_password_hash(payload.password), user_id),
+            )
 
     jti = str(uuid4())
     access = create_access_token(subject=str(user_id), role=role, jti=jti)
@@ -77,13 +85,8 @@ async def login(payload: LoginRequest):
 
     # store refresh token metadata
     with pg_cursor(commit=True) as cur:
-        cur.execute(
-            """
-            INSERT INTO refresh_tokens (user_id, jti, revoked, expires_at)
-            VALUES (%s, %s, false, %s)
-            """,
-            (user_id, jti, datetime.now(timezone.utc) + timedelta(days=14)),
-        )
+        # expiry is computed by the database clock
+        execute_prepared(cur, "insert_refresh", (user_id, jti, REFRESH_TOKEN_EXPIRE_DAYS))
 
     return TokenResponse(access_token=access, refresh_token=refresh, expires_in=60 *  settings.access_token_expire_minutes)
 
@@ -92,22 +95,22 @@ class RefreshRequest(BaseModel):
     refresh_token: str
 
 @router.post("/refresh", response_model=TokenResponse)
-async def refresh_token(payload: RefreshRequest):
+def refresh_token(payload: RefreshRequest):
     try:
         td = decode_token(payload.refresh_token)
-    except JWTError:
+    except InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
     if not td.jti:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token jti")
 
     with pg_cursor() as cur:
-        cur.execute("SELECT user_id, revoked, expires_at FROM refresh_tokens WHERE jti = %s", (td.jti,))
+        execute_prepared(cur, "refresh_by_jti", (td.jti,))
         row = cur.fetchone()
         if not row:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh session not found")
-        user_id, revoked, expires_at = row
-        if revoked or (expires_at and expires_at < datetime.now(timezone.utc)):
+        user_id, revoked, expired = row
+        if revoked or expired:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token expired or revoked")
 
     new_jti = str(uuid4())
@@ -115,32 +118,31 @@ async def refresh_token(payload: RefreshRequest):
     refresh = create_refresh_token(subject=str(user_id), role=td.role, jti=new_jti)
 
     with pg_cursor(commit=True) as cur:
-        # revoke old and add new
-        cur.execute("UPDATE refresh_tokens SET revoked = true WHERE jti = %s", (td.jti,))
-        cur.execute(
-            "INSERT INTO refresh_tokens (user_id, jti, revoked, expires_at) VALUES (%s, %s, false, %s)",
-            (user_id, new_jti, datetime.now(timezone.utc) + timedelta(days=14)),
-        )
+        # revoke old and add new in one round-trip; nothing is inserted if a concurrent refresh won
+        execute_prepared(cur, "rotate_refresh", (td.jti, new_jti, REFRESH_TOKEN_EXPIRE_DAYS))
+        if cur.rowcount == 0:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token expired or revoked")
 
     return TokenResponse(access_token=access, refresh_token=refresh, expires_in=60 * settings.access_token_expire_minutes)
 
 
 @router.post("/logout")
-async def logout(token: str = Body(..., embed=True)):
+def logout(token: str = Body(..., embed=True)):
     # revoke by jti
     td = decode_token(token)
     if td.jti:
         with pg_cursor(commit=True) as cur:
-            cur.execute("UPDATE refresh_tokens SET revoked = true WHERE jti = %s", (td.jti,))
+            execute_prepared(cur, "revoke_refresh", (td.jti,))
+        invalidate_cached_identity(td.jti)
     return {"success": True}
 
 
 @router.get("/me", response_model=MeResponse)
-async def me(identity = Depends(get_current_user)):
+def me(identity = Depends(get_current_user)):
     user_id, role = identity
-    with pg_cursor() as cur:
-        cur.execute("SELECT id, username, email, full_name, role, is_active FROM users WHERE id = %s", (user_id,))
+    with pg_cursor(dict_rows=True) as cur:
+        execute_prepared(cur, "user_by_id", (user_id,))
         row = cur.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="User not found")
-        return MeResponse(id=row[0], username=row[1], email=row[2], full_name=row[3], role=row[4], is_active=row[5])
+        return MeResponse.model_construct(**row)
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends
 from datetime import date, timedelta
-from typing import List, Dict, Any
+from typing import Dict, Any
+import psycopg2.errors
 from app.models.models import DashboardStats
 from app.core.database import pg_cursor
 from app.core.logging import logger
@@ -8,73 +9,96 @@ from app.core.exceptions import DatabaseError
 from app.core.security import get_current_user
 
 
-def _rows_to_dicts(cur) -> List[Dict[str, Any]]:
-    cols = [d[0] for d in cur.description]
-    return [dict(zip(cols, r)) for r in cur.fetchall()]
+# Live aggregates; used when the dashboard_totals materialized view has not been created yet
+_LIVE_TOTALS_SQL = """
+    WITH s AS (
+        SELECT COALESCE(SUM(total_amount),0) AS total_sales FROM sales WHERE payment_status = 'paid'
+    ), p AS (
+        SELECT COALESCE(SUM(total_amount),0) AS total_purchases FROM purchases WHERE payment_status = 'paid'
+    ), pr AS (
+        SELECT (SELECT COUNT(*) FROM products) AS total_products,
+               (SELECT COUNT(*) FROM products WHERE stock_quantity <= minimum_stock) AS low_stock_products
+    ), d AS (
+        SELECT COALESCE(SUM(amount),0) AS total_debts FROM debts WHERE status IN ('pending','partial','overdue')
+    )
+    SELECT s.total_sales, p.total_purchases, pr.total_products, pr.low_stock_products, d.total_debts
+    FROM s, p, pr, d
+"""
+
+
+def refresh_dashboard_totals() -> None:
+    """Refresh the dashboard_totals materialized view without blocking readers."""
+    with pg_cursor(commit=True) as cur:
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY dashboard_totals")
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 @router.get("/stats", response_model=DashboardStats)
-async def get_dashboard_stats():
+def get_dashboard_stats():
     """Get comprehensive dashboard statistics"""
     logger.info("GET /api/dashboard/stats - computing dashboard statistics")
     try:
-        # Totals and counts
-        with pg_cursor() as cur:
-            cur.execute("SELECT COALESCE(SUM(total_amount),0) FROM sales WHERE payment_status = 'paid'")
-            (total_sales,) = cur.fetchone()
-            cur.execute("SELECT COALESCE(SUM(total_amount),0) FROM purchases WHERE payment_status = 'paid'")
-            (total_purchases,) = cur.fetchone()
-            cur.execute("SELECT COUNT(*), COALESCE(SUM(CASE WHEN stock_quantity <= minimum_stock THEN 1 ELSE 0 END),0) FROM products")
-            total_products, low_stock_products = cur.fetchone()
-            cur.execute("SELECT COALESCE(SUM(amount),0) FROM debts WHERE status IN ('pending','partial','overdue')")
-            (total_debts,) = cur.fetchone()
-
-        # Recent sales (5) with item count
-        with pg_cursor() as cur:
+        # All aggregates and recent lists over a single pooled connection
+        with pg_cursor(dict_rows=True) as cur:
+            try:
+                cur.execute(
+                    "SELECT total_sales, total_purchases, total_products, low_stock_products, total_debts FROM dashboard_totals"
+                )
+            except psycopg2.errors.UndefinedTable:
+                cur.connection.rollback()
+                cur.execute(_LIVE_TOTALS_SQL)
+            totals = cur.fetchone()
+
+            # Recent sales (5) with item count
             cur.execute(
                 """
-                SELECT s.*, (
-                    SELECT COUNT(*) FROM sale_items si WHERE si.sale_id = s.id
-                ) AS items_count
-                FROM sales s ORDER BY s.sale_date DESC, s.id DESC LIMIT 5
+                WITH recent AS (
+                    SELECT * FROM sales ORDER BY sale_date DESC, id DESC LIMIT 5
+                ), counts AS (
+                    SELECT si.sale_id, COUNT(*) AS items_count
+                    FROM sale_items si JOIN recent r ON r.id = si.sale_id
+                    GROUP BY si.sale_id
+                )
+                SELECT r.*, COALESCE(c.items_count, 0) AS items_count
+                FROM recent r LEFT JOIN counts c ON c.sale_id = r.id
+                ORDER BY r.sale_date DESC, r.id DESC
                 """
             )
-            recent_sales = _rows_to_dicts(cur)
+            recent_sales = cur.fetchall()
 
-        # Recent purchases (5) with item count
-        with pg_cursor() as cur:
+            # Recent purchases (5) with item count
             cur.execute(
                 """
-                SELECT p.*, (
-                    SELECT COUNT(*) FROM purchase_items pi WHERE pi.purchase_id = p.id
-                ) AS items_count
-                FROM purchases p ORDER BY p.purchase_date DESC, p.id DESC LIMIT 5
+                WITH recent AS (
+                    SELECT * FROM purchases ORDER BY purchase_date DESC, id DESC LIMIT 5
+                ), counts AS (
+                    SELECT pi.purchase_id, COUNT(*) AS items_count
+                    FROM purchase_items pi JOIN recent r ON r.id = pi.purchase_id
+                    GROUP BY pi.purchase_id
+                )
+                SELECT r.*, COALESCE(c.items_count, 0) AS items_count
+                FROM recent r LEFT JOIN counts c ON c.purchase_id = r.id
+                ORDER BY r.purchase_date DESC, r.id DESC
                 """
             )
-            recent_purchases = _rows_to_dicts(cur)
+            recent_purchases = cur.fetchall()
 
-        # Pending debts (10)
-        with pg_cursor() as cur:
+            # Pending debts (10)
             cur.execute(
                 "SELECT * FROM debts WHERE status IN ('pending','partial','overdue') ORDER BY created_at DESC LIMIT 10"
             )
-            pending_debts = _rows_to_dicts(cur)
+            pending_debts = cur.fetchall()
 
         logger.info(
             "Dashboard stats computed | sales=%s purchases=%s debts=%s products=%s low_stock=%s",
-            total_sales,
-            total_purchases,
-            total_debts,
-            total_products,
-            low_stock_products,
+            totals["total_sales"],
+            totals["total_purchases"],
+            totals["total_debts"],
+            totals["total_products"],
+            totals["low_stock_products"],
         )
         return DashboardStats(
-            total_sales=total_sales,
-            total_purchases=total_purchases,
-            total_debts=total_debts,
-            total_products=total_products,
-            low_stock_products=low_stock_products,
+            **totals,
             recent_sales=recent_sales,
             recent_purchases=recent_purchases,
             pending_debts=pending_debts,
@@ -84,33 +108,31 @@ async def get_dashboard_stats():
         raise DatabaseError("Failed to compute dashboard stats")
 
 @router.get("/sales-trend")
-async def get_sales_trend(days: int = 30):
+def get_sales_trend(days: int = 30):
     """Get sales trend for the last N days"""
     end_date = date.today()
     start_date = end_date - timedelta(days=days)
     logger.info("GET /api/dashboard/sales-trend | days=%s", days)
     try:
-        with pg_cursor() as cur:
+        with pg_cursor(dict_rows=True) as cur:
             cur.execute(
                 """
-                SELECT CAST(sale_date AS date) AS d, total_amount, payment_status
+                SELECT CAST(sale_date AS date) AS d,
+                       SUM(total_amount)::float8 AS total,
+                       COUNT(*) AS count,
+                       COALESCE(SUM(total_amount) FILTER (WHERE payment_status = 'paid'), 0)::float8 AS paid
                 FROM sales
                 WHERE sale_date >= %s AND sale_date <= %s
+                GROUP BY d
                 ORDER BY d
                 """,
                 (start_date, end_date),
             )
-            rows = _rows_to_dicts(cur)
-
-        daily_sales: Dict[str, Dict[str, Any]] = {}
-        for r in rows:
-            day = str(r["d"])  # YYYY-MM-DD
-            if day not in daily_sales:
-                daily_sales[day] = {"total": 0, "paid": 0, "count": 0}
-            daily_sales[day]["total"] += r["total_amount"]
-            daily_sales[day]["count"] += 1
-            if r["payment_status"] == "paid":
-                daily_sales[day]["paid"] += r["total_amount"]
+            # Already one row per day, so a plain buffered cursor is the cheapest read
+            daily_sales: Dict[str, Dict[str, Any]] = {
+                str(r["d"]): {"total": r["total"], "paid": r["paid"], "count": r["count"]}  # YYYY-MM-DD
+                for r in cur.fetchall()
+            }
 
         logger.info("Sales trend computed for %s days | days_with_sales=%s", days, len(daily_sales))
         return daily_sales
@@ -119,23 +141,28 @@ async def get_sales_trend(days: int = 30):
         raise DatabaseError("Failed to compute sales trend")
 
 @router.get("/top-products")
-async def get_top_selling_products(limit: int = 10):
+def get_top_selling_products(limit: int = 10):
     """Get top selling products"""
     logger.info("GET /api/dashboard/top-products | limit=%s", limit)
     try:
-        with pg_cursor() as cur:
+        with pg_cursor(dict_rows=True) as cur:
             cur.execute(
                 """
-                SELECT p.id AS product_id, p.name, p.type, COALESCE(SUM(si.quantity),0) AS total_quantity
-                FROM sale_items si
-                JOIN products p ON p.id = si.product_id
-                GROUP BY p.id, p.name, p.type
-                ORDER BY total_quantity DESC
-                LIMIT %s
+                WITH agg AS (
+                    SELECT product_id, SUM(quantity) AS total_quantity
+                    FROM sale_items
+                    GROUP BY product_id
+                    ORDER BY total_quantity DESC
+                    LIMIT %s
+                )
+                SELECT p.id AS product_id, p.name, p.type, agg.total_quantity::float8 AS total_quantity
+                FROM agg
+                JOIN products p ON p.id = agg.product_id
+                ORDER BY agg.total_quantity DESC
                 """,
                 (limit,),
             )
-            rows = _rows_to_dicts(cur)
+            rows = cur.fetchall()
         logger.info("Top products computed | count=%s", len(rows))
         return rows
     except Exception as e:
@@ -143,7 +170,7 @@ async def get_top_selling_products(limit: int = 10):
         raise DatabaseError("Failed to compute top products")
 
 @router.get("/monthly-summary")
-async def get_monthly_summary(year: int = None, month: int = None):
+def get_monthly_summary(year: int = None, month: int = None):
     """Get monthly summary of sales, purchases, and debts"""
     if not year:
         year = date.today().year
@@ -159,23 +186,26 @@ async def get_monthly_summary(year: int = None, month: int = None):
     logger.info("GET /api/dashboard/monthly-summary | year=%s month=%s", year, month)
     try:
         with pg_cursor() as cur:
+            # Independent aggregates evaluated in one statement / one round-trip
             cur.execute(
-                "SELECT COALESCE(SUM(total_amount),0), COALESCE(SUM(CASE WHEN payment_status='paid' THEN total_amount ELSE 0 END),0) FROM sales WHERE sale_date >= %s AND sale_date <= %s",
-                (start_date, end_date),
-            )
-            monthly_sales, paid_sales = cur.fetchone()
-
-            cur.execute(
-                "SELECT COALESCE(SUM(total_amount),0), COALESCE(SUM(CASE WHEN payment_status='paid' THEN total_amount ELSE 0 END),0) FROM purchases WHERE purchase_date >= %s AND purchase_date <= %s",
-                (start_date, end_date),
-            )
-            monthly_purchases, paid_purchases = cur.fetchone()
-
-            cur.execute(
-                "SELECT COALESCE(SUM(amount),0) FROM debts WHERE created_at >= %s AND created_at <= %s",
-                (start_date, end_date),
+                """
+                WITH s AS (
+                    SELECT COALESCE(SUM(total_amount),0) AS total,
+                           COALESCE(SUM(CASE WHEN payment_status='paid' THEN total_amount ELSE 0 END),0) AS paid
+                    FROM sales WHERE sale_date >= %(start)s AND sale_date <= %(end)s
+                ), p AS (
+                    SELECT COALESCE(SUM(total_amount),0) AS total,
+                           COALESCE(SUM(CASE WHEN payment_status='paid' THEN total_amount ELSE 0 END),0) AS paid
+                    FROM purchases WHERE purchase_date >= %(start)s AND purchase_date <= %(end)s
+                ), d AS (
+                    SELECT COALESCE(SUM(amount),0) AS total
+                    FROM debts WHERE created_at >= %(start)s AND created_at <= %(end)s
+                )
+                SELECT s.total, s.paid, p.total, p.paid, d.total FROM s, p, d
+                """,
+                {"start": start_date, "end": end_date},
             )
-            (monthly_debts,) = cur.fetchone()
+            monthly_sales, paid_sales, monthly_purchases, paid_purchases, monthly_debts = cur.fetchone()
 
         payload = {
             "year": year,
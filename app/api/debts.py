@@ -1,21 +1,25 @@
-from fastapi import APIRouter, Query, Depends
-from typing import List, Optional, Any, Dict
+from fastapi import APIRouter, Query, Depends, Response
+from pydantic import TypeAdapter
+from typing import List, Optional, Any
 from datetime import datetime, date
 from app.models.models import Debt, DebtCreate, DebtUpdate, PaymentStatus
-from app.core.database import pg_cursor
+from app.core.cache import debt_summary_cache, DEBT_SUMMARY_KEY
+from app.core.database import pg_cursor, execute_prepared, ilike_contains
 from app.core.logging import logger
 from app.core.exceptions import NotFoundError, BadRequestError, DatabaseError
 from app.core.security import get_current_user, require_admin
 
 
-def _rows_to_dicts(cur) -> List[Dict[str, Any]]:
-    cols = [d[0] for d in cur.description]
-    return [dict(zip(cols, r)) for r in cur.fetchall()]
+# Columns of the Debt response model; selected explicitly instead of SELECT *
+DEBT_COLS = "id, customer_name, customer_phone, amount, description, due_date, status, created_at, updated_at"
+
+# Built once; list endpoints validate and serialize rows through it directly
+DEBT_LIST_ADAPTER = TypeAdapter(List[Debt])
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 @router.get("/", response_model=List[Debt])
-async def get_debts(
+def get_debts(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     status: Optional[PaymentStatus] = None,
@@ -31,6 +35,12 @@ async def get_debts(
         customer_name,
         overdue_only,
     )
+    # overdue_only is just a status filter; fold it in so status is compared once
+    if overdue_only:
+        if status and status != PaymentStatus.OVERDUE:
+            return []
+        status = PaymentStatus.OVERDUE
+
     where = []
     params: List[Any] = []
     if status:
@@ -38,33 +48,31 @@ async def get_debts(
         params.append(status.value)
     if customer_name:
         where.append("customer_name ILIKE %s")
-        params.append(f"%{customer_name}%")
-    if overdue_only:
-        where.append("status = %s")
-        params.append(PaymentStatus.OVERDUE.value)
+        params.append(ilike_contains(customer_name))
 
-    sql = "SELECT * FROM debts"
+    sql = f"SELECT {DEBT_COLS} FROM debts"
     if where:
         sql += " WHERE " + " AND ".join(where)
     sql += " ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s"
     params.extend([limit, skip])
     try:
-        with pg_cursor() as cur:
+        with pg_cursor(dict_rows=True) as cur:
             cur.execute(sql, params)
-            rows = _rows_to_dicts(cur)
-            return rows
+            rows = cur.fetchall()
     except Exception as e:
         logger.error("Failed to fetch debts: %s", e)
         raise DatabaseError("Failed to fetch debts")
 
+    return Response(DEBT_LIST_ADAPTER.dump_json(DEBT_LIST_ADAPTER.validate_python(rows)), media_type="application/json")
+
 @router.get("/{debt_id}", response_model=Debt)
-async def get_debt(debt_id: int):
+def get_debt(debt_id: int):
     """Get a specific debt by ID"""
     logger.info("GET /api/debts/%s", debt_id)
     try:
-        with pg_cursor() as cur:
-            cur.execute("SELECT * FROM debts WHERE id = %s", (debt_id,))
-            rows = _rows_to_dicts(cur)
+        with pg_cursor(dict_rows=True) as cur:
+            execute_prepared(cur, "debt_by_id", (debt_id,))
+            rows = cur.fetchall()
         if not rows:
             raise NotFoundError("Debt not found")
         return rows[0]
@@ -76,16 +84,16 @@ async def get_debt(debt_id: int):
         raise DatabaseError("Failed to fetch debt")
 
 @router.post("/", response_model=Debt)
-async def create_debt(debt: DebtCreate, _: int = Depends(require_admin)):
+def create_debt(debt: DebtCreate, _: int = Depends(require_admin)):
     """Create a new debt record"""
     logger.info("POST /api/debts - creating debt for %s", debt.customer_name)
     try:
-        with pg_cursor(commit=True) as cur:
+        with pg_cursor(commit=True, dict_rows=True) as cur:
             cur.execute(
-            """
+            f"""
             INSERT INTO debts (customer_name, amount, status, due_date, notes, created_at)
             VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id
+            RETURNING {DEBT_COLS}
             """,
             (
                 debt.customer_name,
@@ -96,12 +104,12 @@ async def create_debt(debt: DebtCreate, _: int = Depends(require_admin)):
                 datetime.now(),
             ),
             )
-            row = cur.fetchone()
-            if not row:
+            rows = cur.fetchall()
+            if not rows:
                 raise BadRequestError("Failed to create debt")
-            (debt_id,) = row
-        logger.info("Debt %s created successfully", debt_id)
-        return await get_debt(debt_id)
+        debt_summary_cache.invalidate(DEBT_SUMMARY_KEY)
+        logger.info("Debt %s created successfully", rows[0]["id"])
+        return rows[0]
     except BadRequestError:
         logger.error("Failed to create debt - bad request or insert error")
         raise
@@ -110,14 +118,14 @@ async def create_debt(debt: DebtCreate, _: int = Depends(require_admin)):
         raise DatabaseError("Failed to create debt")
 
 @router.put("/{debt_id}", response_model=Debt)
-async def update_debt(debt_id: int, debt: DebtUpdate, _: int = Depends(require_admin)):
+def update_debt(debt_id: int, debt: DebtUpdate, _: int = Depends(require_admin)):
     """Update a debt record"""
     logger.info("PUT /api/debts/%s", debt_id)
     # Build dynamic update
     data = {k: v for k, v in debt.dict().items() if v is not None}
     if not data:
         logger.info("No fields to update for debt %s", debt_id)
-        return await get_debt(debt_id)
+        return get_debt(debt_id)
     set_parts = []
     params: List[Any] = []
     for k, v in data.items():
@@ -130,16 +138,17 @@ async def update_debt(debt_id: int, debt: DebtUpdate, _: int = Depends(require_a
     params.append(debt_id)
 
     try:
-        with pg_cursor(commit=True) as cur:
+        with pg_cursor(commit=True, dict_rows=True) as cur:
             cur.execute(
-                f"UPDATE debts SET {', '.join(set_parts)} WHERE id = %s RETURNING id",
+                f"UPDATE debts SET {', '.join(set_parts)} WHERE id = %s RETURNING {DEBT_COLS}",
                 params,
             )
-            updated = cur.fetchone()
-            if not updated:
+            rows = cur.fetchall()
+            if not rows:
                 raise NotFoundError("Debt not found")
+        debt_summary_cache.invalidate(DEBT_SUMMARY_KEY)
         logger.info("Debt %s updated", debt_id)
-        return await get_debt(debt_id)
+        return rows[0]
     except NotFoundError:
         logger.error("Debt %s not found for update", debt_id)
         raise
@@ -148,46 +157,48 @@ async def update_debt(debt_id: int, debt: DebtUpdate, _: int = Depends(require_a
         raise DatabaseError("Failed to update debt")
 
 @router.put("/{debt_id}/pay")
-async def pay_debt(debt_id: int, amount: float = Query(...), _: int = Depends(require_admin)):
+def pay_debt(debt_id: int, amount: float = Query(...), _: int = Depends(require_admin)):
     """Make a payment towards a debt"""
     logger.info("PUT /api/debts/%s/pay | amount=%s", debt_id, amount)
     try:
         with pg_cursor(commit=True) as cur:
-            cur.execute("SELECT amount, status FROM debts WHERE id = %s", (debt_id,))
+            # Balance and status are derived from the current row in one atomic UPDATE
+            cur.execute(
+                """
+                UPDATE debts
+                SET amount = GREATEST(0, amount - %(amount)s),
+                    status = CASE
+                        WHEN amount - %(amount)s <= 0 THEN %(paid)s
+                        WHEN amount - %(amount)s < amount THEN %(partial)s
+                        ELSE status
+                    END,
+                    updated_at = now()
+                WHERE id = %(id)s
+                RETURNING amount
+                """,
+                {
+                    "amount": amount,
+                    "paid": PaymentStatus.PAID.value,
+                    "partial": PaymentStatus.PARTIAL.value,
+                    "id": debt_id,
+                },
+            )
             row = cur.fetchone()
             if not row:
                 raise NotFoundError("Debt not found")
-            current_amount, current_status = row
-            new_amount = max(0.0, float(current_amount) - float(amount))
-
-            if new_amount == 0:
-                new_status = PaymentStatus.PAID.value
-            elif new_amount < current_amount:
-                new_status = PaymentStatus.PARTIAL.value
-            else:
-                new_status = current_status
-
-            cur.execute(
-                "UPDATE debts SET amount = %s, status = %s, updated_at = %s WHERE id = %s RETURNING id",
-                (new_amount, new_status, datetime.now(), debt_id),
-            )
-            updated = cur.fetchone()
-            if not updated:
-                raise BadRequestError("Failed to update debt payment")
+            new_amount = float(row[0])
+        debt_summary_cache.invalidate(DEBT_SUMMARY_KEY)
         logger.info("Debt %s payment updated | remaining=%s", debt_id, new_amount)
         return {"message": f"Payment recorded. Remaining debt: {new_amount}"}
     except NotFoundError:
         logger.error("Debt %s not found for payment", debt_id)
         raise
-    except BadRequestError:
-        logger.error("Failed to update payment for debt %s - bad request", debt_id)
-        raise
     except Exception as e:
         logger.error("Failed to update debt payment %s: %s", debt_id, e)
         raise DatabaseError("Failed to update debt payment")
 
 @router.delete("/{debt_id}")
-async def delete_debt(debt_id: int, _: int = Depends(require_admin)):
+def delete_debt(debt_id: int, _: int = Depends(require_admin)):
     """Delete a debt record"""
     logger.info("DELETE /api/debts/%s", debt_id)
     try:
@@ -196,6 +207,7 @@ async def delete_debt(debt_id: int, _: int = Depends(require_admin)):
             deleted = cur.fetchone()
             if not deleted:
                 raise NotFoundError("Debt not found")
+        debt_summary_cache.invalidate(DEBT_SUMMARY_KEY)
         logger.info("Debt %s deleted", debt_id)
         return {"message": "Debt deleted successfully"}
     except NotFoundError:
@@ -206,9 +218,12 @@ async def delete_debt(debt_id: int, _: int = Depends(require_admin)):
         raise DatabaseError("Failed to delete debt")
 
 @router.get("/stats/summary")
-async def get_debt_summary():
+def get_debt_summary():
     """Get debt summary statistics"""
     logger.info("GET /api/debts/stats/summary")
+    cached = debt_summary_cache.get(DEBT_SUMMARY_KEY)
+    if cached is not None:
+        return cached
     try:
         with pg_cursor() as cur:
             cur.execute(
@@ -231,6 +246,7 @@ async def get_debt_summary():
             "overdue_debt": overdue_debt,
             "total_records": total_records,
         }
+        debt_summary_cache.set(DEBT_SUMMARY_KEY, payload)
         logger.info("Debt summary computed")
         return payload
     except Exception as e:
@@ -238,7 +254,7 @@ async def get_debt_summary():
         raise DatabaseError("Failed to compute debt summary")
 
 @router.post("/mark-overdue")
-async def mark_overdue_debts(_: int = Depends(require_admin)):
+def mark_overdue_debts(_: int = Depends(require_admin)):
     """Mark debts as overdue based on due date"""
     current_date = date.today()
     logger.info("POST /api/debts/mark-overdue | date=%s", current_date)
@@ -249,13 +265,13 @@ async def mark_overdue_debts(_: int = Depends(require_admin)):
             UPDATE debts
             SET status = %s, updated_at = %s
             WHERE due_date < %s AND status IN ('pending','partial')
-            RETURNING id
             """,
             (PaymentStatus.OVERDUE.value, datetime.now(), current_date),
             )
-            updated_rows = cur.fetchall()
-        logger.info("Marked %s debts as overdue", len(updated_rows))
-        return {"message": f"Marked {len(updated_rows)} debts as overdue"}
+            updated = cur.rowcount
+        debt_summary_cache.invalidate(DEBT_SUMMARY_KEY)
+        logger.info("Marked %s debts as overdue", updated)
+        return {"message": f"Marked {updated} debts as overdue"}
     except Exception as e:
         logger.error("Failed to mark overdue debts: %s", e)
         raise DatabaseError("Failed to mark overdue debts")
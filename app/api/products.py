@@ -1,21 +1,24 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
-from typing import List, Optional, Any, Dict
+from fastapi import APIRouter, HTTPException, Query, Depends, Response
+from pydantic import TypeAdapter
+from typing import List, Optional, Any
 from app.models.models import Product, ProductCreate, ProductUpdate, ProductType
-from app.core.database import pg_cursor
+from app.core.cache import product_cache
+from app.core.database import pg_cursor, execute_prepared, ilike_contains
 from app.core.logging import logger
 from app.core.exceptions import NotFoundError, BadRequestError, DatabaseError
 from app.core.security import get_current_user, require_admin
 
 
-def _rows_to_dicts(cur) -> List[Dict[str, Any]]:
-    """Convert psycopg2 cursor results to list of dicts."""
-    columns = [desc[0] for desc in cur.description]
-    return [dict(zip(columns, row)) for row in cur.fetchall()]
+# Columns of the Product response model; selected explicitly instead of SELECT *
+PRODUCT_COLS = "id, name, type, brand, unit, price_per_unit, stock_quantity, minimum_stock, description, created_at, updated_at"
+
+# Built once; list endpoints validate and serialize rows through it directly
+PRODUCT_LIST_ADAPTER = TypeAdapter(List[Product])
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 @router.get("/", response_model=List[Product])
-async def get_products(
+def get_products(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     product_type: Optional[ProductType] = None,
@@ -29,7 +32,7 @@ async def get_products(
         product_type.value if product_type else None,
         search,
     )
-    sql = "SELECT * FROM products"
+    sql = f"SELECT {PRODUCT_COLS} FROM products"
     clauses = []
     params: List[Any] = []
 
@@ -39,7 +42,7 @@ async def get_products(
 
     if search:
         clauses.append("(name ILIKE %s OR brand ILIKE %s)")
-        like = f"%{search}%"
+        like = ilike_contains(search)
         params.extend([like, like])
 
     if clauses:
@@ -49,25 +52,30 @@ async def get_products(
     params.extend([limit, skip])
 
     try:
-        with pg_cursor() as cur:
+        with pg_cursor(dict_rows=True) as cur:
             cur.execute(sql, params)
-            rows = _rows_to_dicts(cur)
-            return rows
+            rows = cur.fetchall()
     except Exception as e:
         logger.error("Failed to fetch products: %s", e)
         raise DatabaseError("Failed to fetch products")
 
+    return Response(PRODUCT_LIST_ADAPTER.dump_json(PRODUCT_LIST_ADAPTER.validate_python(rows)), media_type="application/json")
+
 @router.get("/{product_id}", response_model=Product)
-async def get_product(product_id: int):
+def get_product(product_id: int):
     """Get a specific product by ID"""
     logger.info("GET /api/products/%s", product_id)
+    cached = product_cache.get(product_id)
+    if cached is not None:
+        return cached
     try:
-        with pg_cursor() as cur:
-            cur.execute("SELECT * FROM products WHERE id = %s", (product_id,))
-            rows = _rows_to_dicts(cur)
+        with pg_cursor(dict_rows=True) as cur:
+            execute_prepared(cur, "product_by_id", (product_id,))
+            rows = cur.fetchall()
             if not rows:
                 raise NotFoundError("Product not found")
-            return rows[0]
+        product_cache.set(product_id, rows[0])
+        return rows[0]
     except NotFoundError:
         logger.error("Product %s not found", product_id)
         raise
@@ -76,7 +84,7 @@ async def get_product(product_id: int):
         raise DatabaseError("Failed to fetch product")
 
 @router.post("/", response_model=Product)
-async def create_product(product: ProductCreate, _: int = Depends(require_admin)):
+def create_product(product: ProductCreate, _: int = Depends(require_admin)):
     """Create a new product"""
     logger.info("POST /api/products - creating product")
     data = product.dict()
@@ -88,12 +96,12 @@ async def create_product(product: ProductCreate, _: int = Depends(require_admin)
     placeholders = ",".join(["%s"] * len(columns))
     cols_sql = ",".join(columns)
 
-    sql = f"INSERT INTO products ({cols_sql}) VALUES ({placeholders}) RETURNING *"
+    sql = f"INSERT INTO products ({cols_sql}) VALUES ({placeholders}) RETURNING {PRODUCT_COLS}"
 
     try:
-        with pg_cursor(commit=True) as cur:
+        with pg_cursor(commit=True, dict_rows=True) as cur:
             cur.execute(sql, values)
-            rows = _rows_to_dicts(cur)
+            rows = cur.fetchall()
             if not rows:
                 raise BadRequestError("Failed to create product")
             logger.info("Product created id=%s", rows[0].get("id"))
@@ -106,35 +114,27 @@ async def create_product(product: ProductCreate, _: int = Depends(require_admin)
         raise DatabaseError("Failed to create product")
 
 @router.put("/{product_id}", response_model=Product)
-async def update_product(product_id: int, product: ProductUpdate, _: int = Depends(require_admin)):
+def update_product(product_id: int, product: ProductUpdate, _: int = Depends(require_admin)):
     """Update a product"""
     logger.info("PUT /api/products/%s", product_id)
-    # Ensure exists
-    with pg_cursor() as cur:
-        cur.execute("SELECT 1 FROM products WHERE id = %s", (product_id,))
-        if cur.fetchone() is None:
-            raise NotFoundError("Product not found")
-
     update_data = {k: v for k, v in product.dict().items() if v is not None}
     if not update_data:
         # Nothing to update; return current row
-        with pg_cursor() as cur:
-            cur.execute("SELECT * FROM products WHERE id = %s", (product_id,))
-            rows = _rows_to_dicts(cur)
-            return rows[0]
+        return get_product(product_id)
 
     set_clauses = ", ".join([f"{k} = %s" for k in update_data.keys()])
     params = list(update_data.values()) + [product_id]
-    sql = f"UPDATE products SET {set_clauses} WHERE id = %s RETURNING *"
+    sql = f"UPDATE products SET {set_clauses} WHERE id = %s RETURNING {PRODUCT_COLS}"
 
     try:
-        with pg_cursor(commit=True) as cur:
+        with pg_cursor(commit=True, dict_rows=True) as cur:
             cur.execute(sql, params)
-            rows = _rows_to_dicts(cur)
+            rows = cur.fetchall()
             if not rows:
-                raise BadRequestError("Failed to update product")
-            logger.info("Product %s updated", product_id)
-            return rows[0]
+                raise NotFoundError("Product not found")
+        product_cache.invalidate(product_id)
+        logger.info("Product %s updated", product_id)
+        return rows[0]
     except NotFoundError:
         logger.error("Product %s not found for update", product_id)
         raise
@@ -146,7 +146,7 @@ async def update_product(product_id: int, product: ProductUpdate, _: int = Depen
         raise DatabaseError("Failed to update product")
 
 @router.delete("/{product_id}")
-async def delete_product(product_id: int, _: int = Depends(require_admin)):
+def delete_product(product_id: int, _: int = Depends(require_admin)):
     """Delete a product"""
     logger.info("DELETE /api/products/%s", product_id)
     try:
@@ -155,6 +155,7 @@ async def delete_product(product_id: int, _: int = Depends(require_admin)):
             deleted = cur.fetchone()
             if not deleted:
                 raise NotFoundError("Product not found")
+        product_cache.invalidate(product_id)
         logger.info("Product %s deleted", product_id)
         return {"message": "Product deleted successfully"}
     except NotFoundError:
@@ -165,45 +166,43 @@ async def delete_product(product_id: int, _: int = Depends(require_admin)):
         raise DatabaseError("Failed to delete product")
 
 @router.get("/low-stock/", response_model=List[Product])
-async def get_low_stock_products():
+def get_low_stock_products():
     """Get products with low stock"""
     logger.info("GET /api/products/low-stock")
     try:
-        with pg_cursor() as cur:
-            cur.execute("SELECT * FROM products WHERE stock_quantity < minimum_stock")
-            return _rows_to_dicts(cur)
+        with pg_cursor(dict_rows=True) as cur:
+            cur.execute(f"SELECT {PRODUCT_COLS} FROM products WHERE stock_quantity < minimum_stock")
+            rows = cur.fetchall()
     except Exception as e:
         logger.error("Failed to fetch low stock products: %s", e)
         raise DatabaseError("Failed to fetch low stock products")
 
+    return Response(PRODUCT_LIST_ADAPTER.dump_json(PRODUCT_LIST_ADAPTER.validate_python(rows)), media_type="application/json")
+
 @router.post("/{product_id}/update-stock")
-async def update_stock(product_id: int, quantity: float, operation: str = "add", _: int = Depends(require_admin)):
+def update_stock(product_id: int, quantity: float, operation: str = "add", _: int = Depends(require_admin)):
     """Update product stock (add or subtract)"""
     logger.info("POST /api/products/%s/update-stock | qty=%s op=%s", product_id, quantity, operation)
     try:
+        if operation == "add":
+            delta = quantity
+        elif operation == "subtract":
+            delta = -quantity
+        else:
+            raise BadRequestError("Operation must be 'add' or 'subtract'")
+
         with pg_cursor(commit=True) as cur:
-            # Get current stock
-            cur.execute("SELECT stock_quantity FROM products WHERE id = %s", (product_id,))
+            # Apply the change in SQL so concurrent updates cannot overwrite each other
+            cur.execute(
+                "UPDATE products SET stock_quantity = GREATEST(0, stock_quantity + %s) WHERE id = %s RETURNING stock_quantity",
+                (delta, product_id),
+            )
             row = cur.fetchone()
             if not row:
                 raise NotFoundError("Product not found")
-            (current_stock,) = row
-
-            if operation == "add":
-                new_stock = current_stock + quantity
-            elif operation == "subtract":
-                new_stock = max(0, current_stock - quantity)
-            else:
-                raise BadRequestError("Operation must be 'add' or 'subtract'")
-
-            cur.execute(
-                "UPDATE products SET stock_quantity = %s WHERE id = %s RETURNING stock_quantity",
-                (new_stock, product_id),
-            )
-            updated = cur.fetchone()
-            if not updated:
-                raise BadRequestError("Failed to update stock")
+            new_stock = float(row[0])
 
+        product_cache.invalidate(product_id)
         logger.info("Stock updated for product %s -> %s", product_id, new_stock)
         return {"message": f"Stock updated successfully. New stock: {new_stock}"}
     except NotFoundError:
@@ -1,21 +1,26 @@
-from fastapi import APIRouter, Query, Depends
-from typing import List, Optional, Any, Dict
+from fastapi import APIRouter, Query, Depends, Response
+from pydantic import TypeAdapter
+from typing import List, Optional, Any
 from datetime import datetime, date, timedelta
 from app.models.models import Purchase, PurchaseCreate, PaymentStatus
-from app.core.database import pg_cursor
+from psycopg2.extras import execute_values
+from app.core.cache import product_cache
+from app.core.database import pg_cursor, execute_prepared, ilike_contains
 from app.core.logging import logger
 from app.core.exceptions import NotFoundError, BadRequestError, DatabaseError
 from app.core.security import get_current_user, require_admin
 
 
-def _rows_to_dicts(cur) -> List[Dict[str, Any]]:
-    cols = [d[0] for d in cur.description]
-    return [dict(zip(cols, r)) for r in cur.fetchall()]
+# Columns of the Purchase response model (items are aggregated separately)
+PURCHASE_COLS = "id, supplier_name, supplier_phone, supplier_address, total_amount, paid_amount, payment_status, notes, purchase_date, created_at, updated_at"
+
+# Built once; list endpoints validate and serialize rows through it directly
+PURCHASE_LIST_ADAPTER = TypeAdapter(List[Purchase])
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 @router.get("/", response_model=List[Purchase])
-async def get_purchases(
+def get_purchases(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     start_date: Optional[date] = None,
@@ -46,70 +51,57 @@ async def get_purchases(
         params.append(payment_status.value)
     if supplier_name:
         where.append("supplier_name ILIKE %s")
-        params.append(f"%{supplier_name}%")
+        params.append(ilike_contains(supplier_name))
 
-    sql = "SELECT * FROM purchases"
+    sql = f"SELECT {PURCHASE_COLS} FROM purchases"
     if where:
         sql += " WHERE " + " AND ".join(where)
     sql += " ORDER BY purchase_date DESC, id DESC LIMIT %s OFFSET %s"
     params.extend([limit, skip])
 
+    # Page of purchases with each one's items aggregated server-side: one round-trip, no Python grouping
+    sql = f"""
+        SELECT p.*,
+               (
+                   SELECT COALESCE(
+                       json_agg(
+                           json_build_object(
+                               'id', pi.id, 'purchase_id', pi.purchase_id, 'product_id', pi.product_id,
+                               'quantity', pi.quantity, 'unit_price', pi.unit_price, 'total_price', pi.total_price,
+                               'product_name', pr.name, 'product_unit', pr.unit
+                           ) ORDER BY pi.id
+                       ),
+                       '[]'
+                   )
+                   FROM purchase_items pi JOIN products pr ON pr.id = pi.product_id
+                   WHERE pi.purchase_id = p.id
+               ) AS items
+        FROM ({sql}) p
+        ORDER BY p.purchase_date DESC, p.id DESC
+    """
+
     try:
-        with pg_cursor() as cur:
+        with pg_cursor(dict_rows=True) as cur:
             cur.execute(sql, params)
-            purchases = _rows_to_dicts(cur)
+            purchases = cur.fetchall()
     except Exception as e:
         logger.error("Failed to fetch purchases: %s", e)
         raise DatabaseError("Failed to fetch purchases")
 
-    if not purchases:
-        return []
-
-    purchase_ids = [p["id"] for p in purchases]
-    placeholders = ",".join(["%s"] * len(purchase_ids))
-    items_sql = (
-        "SELECT pi.*, pr.name AS product_name, pr.unit AS product_unit "
-        "FROM purchase_items pi JOIN products pr ON pr.id = pi.product_id "
-        f"WHERE pi.purchase_id IN ({placeholders}) ORDER BY pi.purchase_id, pi.id"
-    )
-    try:
-        with pg_cursor() as cur:
-            cur.execute(items_sql, purchase_ids)
-            items = _rows_to_dicts(cur)
-    except Exception as e:
-        logger.error("Failed to load purchase items: %s", e)
-        raise DatabaseError("Failed to fetch purchase items")
-
-    by_purchase: Dict[int, List[Dict[str, Any]]] = {}
-    for it in items:
-        by_purchase.setdefault(it["purchase_id"], []).append(it)
-
-    for p in purchases:
-        p["items"] = by_purchase.get(p["id"], [])
-    return purchases
+    return Response(PURCHASE_LIST_ADAPTER.dump_json(PURCHASE_LIST_ADAPTER.validate_python(purchases)), media_type="application/json")
 
 @router.get("/{purchase_id}", response_model=Purchase)
-async def get_purchase(purchase_id: int):
+def get_purchase(purchase_id: int):
     """Get a specific purchase by ID with items and product info"""
     logger.info("GET /api/purchases/%s", purchase_id)
     try:
-        with pg_cursor() as cur:
-            cur.execute("SELECT * FROM purchases WHERE id = %s", (purchase_id,))
-            rows = _rows_to_dicts(cur)
+        with pg_cursor(dict_rows=True) as cur:
+            # Purchase row and its items in one round-trip; psycopg2 decodes the json column
+            execute_prepared(cur, "purchase_with_items", (purchase_id,))
+            rows = cur.fetchall()
             if not rows:
                 raise NotFoundError("Purchase not found")
             purchase = rows[0]
-
-        with pg_cursor() as cur:
-            cur.execute(
-                """
-                SELECT pi.*, pr.name AS product_name, pr.unit AS product_unit
-                FROM purchase_items pi JOIN products pr ON pr.id = pi.product_id
-                WHERE pi.purchase_id = %s ORDER BY pi.id
-                """,
-                (purchase_id,),
-            )
-            purchase["items"] = _rows_to_dicts(cur)
         return purchase
     except NotFoundError:
         logger.error("Purchase %s not found", purchase_id)
@@ -119,7 +111,7 @@ async def get_purchase(purchase_id: int):
         raise DatabaseError("Failed to load purchase")
 
 @router.post("/", response_model=Purchase)
-async def create_purchase(purchase: PurchaseCreate, _: int = Depends(require_admin)):
+def create_purchase(purchase: PurchaseCreate, _: int = Depends(require_admin)):
     """Create a new purchase and increase product stock"""
     logger.info("POST /api/purchases - creating purchase for %s", purchase.supplier_name)
     total_amount = sum(item.total_price for item in purchase.items)
@@ -150,21 +142,28 @@ async def create_purchase(purchase: PurchaseCreate, _: int = Depends(require_adm
                 raise BadRequestError("Failed to create purchase")
             (purchase_id,) = row
 
-            for item in purchase.items:
-                cur.execute(
-                """
-                INSERT INTO purchase_items (purchase_id, product_id, quantity, unit_price, total_price)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (purchase_id, item.product_id, item.quantity, item.unit_price, item.total_price),
+            if purchase.items:
+                # One INSERT for all items and one UPDATE for all stock changes (2 round-trips, not 2N)
+                execute_values(
+                    cur,
+                    "INSERT INTO purchase_items (purchase_id, product_id, quantity, unit_price, total_price) VALUES %s",
+                    [(purchase_id, i.product_id, i.quantity, i.unit_price, i.total_price) for i in purchase.items],
+                    page_size=len(purchase.items),
                 )
-                # Increase stock
-                cur.execute(
-                "UPDATE products SET stock_quantity = stock_quantity + %s WHERE id = %s",
-                (item.quantity, item.product_id),
+                # Increase stock; repeated products are summed so each row is updated once
+                execute_values(
+                    cur,
+                    """
+                    UPDATE products p SET stock_quantity = p.stock_quantity + v.qty
+                    FROM (SELECT product_id, SUM(quantity) AS qty FROM (VALUES %s) AS v(product_id, quantity) GROUP BY product_id) v
+                    WHERE p.id = v.product_id
+                    """,
+                    [(i.product_id, i.quantity) for i in purchase.items],
+                    page_size=len(purchase.items),
                 )
+        product_cache.invalidate_many({i.product_id for i in purchase.items})
         logger.info("Purchase %s created successfully", purchase_id)
-        return await get_purchase(purchase_id)
+        return get_purchase(purchase_id)
     except BadRequestError:
         logger.error("Failed to create purchase - validation or insert error")
         raise
@@ -173,7 +172,7 @@ async def create_purchase(purchase: PurchaseCreate, _: int = Depends(require_adm
         raise DatabaseError("Failed to create purchase")
 
 @router.put("/{purchase_id}/payment")
-async def update_payment(purchase_id: int, paid_amount: float = Query(...), _: int = Depends(require_admin)):
+def update_payment(purchase_id: int, paid_amount: float = Query(...), _: int = Depends(require_admin)):
     """Update payment for a purchase"""
     logger.info("PUT /api/purchases/%s/payment | paid_amount=%s", purchase_id, paid_amount)
     try:
@@ -207,26 +206,32 @@ async def update_payment(purchase_id: int, paid_amount: float = Query(...), _: i
         raise DatabaseError("Failed to update purchase payment")
 
 @router.delete("/{purchase_id}")
-async def delete_purchase(purchase_id: int, _: int = Depends(require_admin)):
+def delete_purchase(purchase_id: int, _: int = Depends(require_admin)):
     """Delete a purchase and adjust stock"""
     logger.info("DELETE /api/purchases/%s", purchase_id)
     try:
         with pg_cursor(commit=True) as cur:
-            cur.execute("SELECT product_id, quantity FROM purchase_items WHERE purchase_id = %s", (purchase_id,))
-            items = cur.fetchall()
-
-            # Reduce stock for each item that was added by this purchase
-            for product_id, qty in items:
-                cur.execute(
-                    "UPDATE products SET stock_quantity = GREATEST(0, stock_quantity - %s) WHERE id = %s",
-                    (qty, product_id),
-                )
+            # Reduce stock for every product added by this purchase in one statement
+            cur.execute(
+                """
+                UPDATE products p SET stock_quantity = GREATEST(0, p.stock_quantity - pi.qty)
+                FROM (
+                    SELECT product_id, SUM(quantity) AS qty FROM purchase_items
+                    WHERE purchase_id = %s GROUP BY product_id
+                ) pi
+                WHERE p.id = pi.product_id
+                RETURNING p.id
+                """,
+                (purchase_id,),
+            )
+            product_ids = [r[0] for r in cur.fetchall()]
 
             cur.execute("DELETE FROM purchase_items WHERE purchase_id = %s", (purchase_id,))
             cur.execute("DELETE FROM purchases WHERE id = %s RETURNING id", (purchase_id,))
             deleted = cur.fetchone()
             if not deleted:
                 raise NotFoundError("Purchase not found")
+        product_cache.invalidate_many(product_ids)
         logger.info("Purchase %s deleted", purchase_id)
         return {"message": "Purchase deleted successfully"}
     except NotFoundError:
@@ -237,7 +242,7 @@ async def delete_purchase(purchase_id: int, _: int = Depends(require_admin)):
         raise DatabaseError("Failed to delete purchase")
 
 @router.get("/stats/daily")
-async def get_daily_purchase_stats(date_filter: Optional[date] = None):
+def get_daily_purchase_stats(date_filter: Optional[date] = None):
     """Get daily purchase statistics"""
     if not date_filter:
         date_filter = date.today()
@@ -246,21 +251,31 @@ async def get_daily_purchase_stats(date_filter: Optional[date] = None):
     try:
         with pg_cursor() as cur:
             cur.execute(
-                "SELECT total_amount, payment_status FROM purchases WHERE purchase_date >= %s AND purchase_date < %s",
-                (date_filter, next_day),
+                """
+                SELECT
+                    COALESCE(SUM(total_amount), 0),
+                    COALESCE(SUM(total_amount) FILTER (WHERE payment_status = %s), 0),
+                    COALESCE(SUM(total_amount) FILTER (WHERE payment_status IN (%s, %s)), 0),
+                    COUNT(*)
+                FROM purchases
+                WHERE purchase_date >= %s AND purchase_date < %s
+                """,
+                (
+                    PaymentStatus.PAID.value,
+                    PaymentStatus.PENDING.value,
+                    PaymentStatus.PARTIAL.value,
+                    date_filter,
+                    next_day,
+                ),
             )
-            rows = cur.fetchall()
-
-        total_purchases = sum(r[0] for r in rows)
-        paid_purchases = sum(r[0] for r in rows if r[1] == PaymentStatus.PAID.value)
-        pending_purchases = sum(r[0] for r in rows if r[1] in (PaymentStatus.PENDING.value, PaymentStatus.PARTIAL.value))
+            total_purchases, paid_purchases, pending_purchases, total_transactions = cur.fetchone()
 
         payload = {
             "date": date_filter,
             "total_purchases": total_purchases,
             "paid_purchases": paid_purchases,
             "pending_purchases": pending_purchases,
-            "total_transactions": len(rows),
+            "total_transactions": total_transactions,
         }
         logger.info("Daily purchase stats computed | date=%s", date_filter)
         return payload
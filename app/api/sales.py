@@ -1,117 +1,274 @@
-from fastapi import APIRouter, Query, Depends
-from typing import List, Optional, Any, Dict
+from fastapi import APIRouter, Query, Depends, Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from itertools import chain
+import threading
+from urllib.parse import urlencode
 from datetime import datetime, date, timedelta
-from app.models.models import Sale, SaleCreate, PaymentStatus
-from app.core.database import pg_cursor
+from app.models.models import Sale, SaleCreate, SaleSummary, PaymentStatus
+from app.core.cache import (
+    product_cache,
+    sales_list_cache,
+    sales_stats_history_cache,
+    sales_stats_today_cache,
+    invalidate_sales_caches,
+)
+from app.core.database import pg_cursor, execute_prepared, ilike_contains, STREAM_BATCH_ROWS
+from app.core.config import settings
 from app.core.logging import logger
-from app.core.exceptions import NotFoundError, BadRequestError, DatabaseError
+from app.core.exceptions import NotFoundError, BadRequestError, DatabaseError, ServiceUnavailableError
 from app.core.security import get_current_user, require_admin
 
 
-def _rows_to_dicts(cur) -> List[Dict[str, Any]]:
-    columns = [d[0] for d in cur.description]
-    return [dict(zip(columns, row)) for row in cur.fetchall()]
+# Columns of the Sale response model (items are aggregated separately)
+SALE_COLS = "id, customer_name, customer_phone, customer_address, total_amount, paid_amount, payment_status, notes, sale_date, created_at, updated_at"
+# Columns of SaleSummary; skips the free-text address/notes and the items
+SALE_SUMMARY_COLS = "id, customer_name, customer_phone, total_amount, paid_amount, payment_status, sale_date, created_at, updated_at"
+
+SALE_SUMMARY_LIST_ADAPTER = TypeAdapter(List[SaleSummary])
+SALE_ADAPTER = TypeAdapter(Sale)
+
+# Row cap for GET /sales/stream
+STREAM_DEFAULT_ROWS = 10_000
+STREAM_MAX_ROWS = 50_000
+# Streams in flight; kept well below the pool size so slow readers cannot starve other requests
+_stream_slots = threading.BoundedSemaphore(max(1, settings.db_stream_max_concurrent))
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
+def _sales_filters(
+    start_date: Optional[date],
+    end_date: Optional[date],
+    payment_status: Optional[PaymentStatus],
+    customer_name: Optional[str],
+) -> Tuple[List[str], List[Any]]:
+    """WHERE clauses and params shared by the sales list and stream endpoints."""
+    where: List[str] = []
+    params: List[Any] = []
+    if start_date:
+        where.append("sale_date >= %s")
+        params.append(start_date)
+    if end_date:
+        where.append("sale_date <= %s")
+        params.append(end_date)
+    if payment_status:
+        where.append("payment_status = %s")
+        params.append(payment_status.value)
+    if customer_name:
+        where.append("customer_name ILIKE %s")
+        params.append(ilike_contains(customer_name))
+    return where, params
+
+def _with_items(sql: str) -> str:
+    """Wrap an ordered sales query so each row carries its items (and product info), aggregated server-side."""
+    return f"""
+        SELECT s.*,
+               (
+                   SELECT COALESCE(
+                       json_agg(
+                           json_build_object(
+                               'id', si.id, 'sale_id', si.sale_id, 'product_id', si.product_id,
+                               'quantity', si.quantity, 'unit_price', si.unit_price, 'total_price', si.total_price,
+                               'product_name', p.name, 'product_unit', p.unit
+                           ) ORDER BY si.id
+                       ),
+                       '[]'
+                   )
+                   FROM sale_items si JOIN products p ON p.id = si.product_id
+                   WHERE si.sale_id = s.id
+               ) AS items
+        FROM ({sql}) s
+        ORDER BY s.sale_date DESC, s.id DESC
+    """
+
+
 @router.get("/", response_model=List[Sale])
-async def get_sales(
+def get_sales(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    payment_status: Optional[PaymentStatus] = None,
+    customer_name: Optional[str] = None,
+    after_date: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+):
+    """Get all sales with optional filtering, including sale items and product info.
+
+    Pages can be walked with after_date/after_id (keyset) instead of skip; a full page
+    carries the complete query string for the next one (filters, limit and the
+    cursor pair) in the X-Next-Cursor header.
+    """
+    return _list_sales(
+        response, skip, limit, start_date, end_date, payment_status, customer_name, after_date, after_id, summary=False
+    )
+
+@router.get("/summary", response_model=List[SaleSummary])
+def get_sales_summary(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     payment_status: Optional[PaymentStatus] = None,
-    customer_name: Optional[str] = None
+    customer_name: Optional[str] = None,
+    after_date: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+):
+    """Same listing and paging as GET /sales, as SaleSummary rows (no address, notes or items)."""
+    return _list_sales(
+        response, skip, limit, start_date, end_date, payment_status, customer_name, after_date, after_id, summary=True
+    )
+
+def _list_sales(
+    response: Response,
+    skip: int,
+    limit: int,
+    start_date: Optional[date],
+    end_date: Optional[date],
+    payment_status: Optional[PaymentStatus],
+    customer_name: Optional[str],
+    after_date: Optional[datetime],
+    after_id: Optional[int],
+    summary: bool,
 ):
-    """Get all sales with optional filtering, including sale items and product info."""
     logger.info(
-        "GET /api/sales | skip=%s limit=%s start=%s end=%s status=%s customer=%s",
+        "GET /api/sales%s | skip=%s limit=%s start=%s end=%s status=%s customer=%s after=%s/%s",
+        "/summary" if summary else "",
         skip,
         limit,
         start_date,
         end_date,
         payment_status.value if payment_status else None,
         customer_name,
+        after_date,
+        after_id,
     )
-    where = []
-    params: List[Any] = []
-    if start_date:
-        where.append("sale_date >= %s")
-        params.append(start_date)
-    if end_date:
-        where.append("sale_date <= %s")
-        params.append(end_date)
-    if payment_status:
-        where.append("payment_status = %s")
-        params.append(payment_status.value)
-    if customer_name:
-        where.append("customer_name ILIKE %s")
-        params.append(f"%{customer_name}%")
+    if (after_date is None) != (after_id is None):
+        raise BadRequestError("after_date and after_id must be given together")
+    keyset = after_id is not None
+    if keyset and skip:
+        raise BadRequestError("skip cannot be combined with after_date/after_id")
+    # Everything but the cursor, so X-Next-Cursor can carry the same listing forward
+    page_query = {
+        "limit": limit,
+        "start_date": start_date,
+        "end_date": end_date,
+        "payment_status": payment_status.value if payment_status else None,
+        "customer_name": customer_name,
+    }
 
-    sql = "SELECT * FROM sales"
+    unfiltered = not (start_date or end_date or payment_status or customer_name or keyset)
+    cache_key = (skip, limit, summary)
+    sales = sales_list_cache.get(cache_key) if unfiltered else None
+    if sales is not None:
+        return _sales_response(sales, summary, page_query, response)
+
+    where, params = _sales_filters(start_date, end_date, payment_status, customer_name)
+    if keyset:
+        # Seek past the previous page on the (sale_date DESC, id DESC) index instead of OFFSET
+        where.append("(sale_date, id) < (%s, %s)")
+        params.extend([after_date, after_id])
+
+    sql = f"SELECT {SALE_SUMMARY_COLS if summary else SALE_COLS} FROM sales"
     if where:
         sql += " WHERE " + " AND ".join(where)
-    sql += " ORDER BY sale_date DESC, id DESC LIMIT %s OFFSET %s"
-    params.extend([limit, skip])
+    sql += " ORDER BY sale_date DESC, id DESC LIMIT %s"
+    params.append(limit)
+    if skip:
+        sql += " OFFSET %s"
+        params.append(skip)
+
+    if not summary:
+        sql = _with_items(sql)
 
     try:
-        with pg_cursor() as cur:
+        with pg_cursor(dict_rows=True) as cur:
             cur.execute(sql, params)
-            sales = _rows_to_dicts(cur)
+            sales = cur.fetchall()
     except Exception as e:
         logger.error("Failed to fetch sales: %s", e)
         raise DatabaseError("Failed to fetch sales")
 
-    if not sales:
-        return []
+    if unfiltered:
+        sales_list_cache.set(cache_key, sales)
+    return _sales_response(sales, summary, page_query, response)
+
+def _sales_response(sales: List[dict], summary: bool, page_query: Dict[str, Any], response: Response):
+    """Attach the next-page query string; summary rows are encoded directly through their adapter."""
+    if summary:
+        response = Response(SALE_SUMMARY_LIST_ADAPTER.dump_json(SALE_SUMMARY_LIST_ADAPTER.validate_python(sales)), media_type="application/json")
+    if len(sales) == page_query["limit"]:
+        last = sales[-1]
+        next_query = {k: v for k, v in page_query.items() if v is not None}
+        next_query.update(after_date=last["sale_date"].isoformat(), after_id=last["id"])
+        response.headers["X-Next-Cursor"] = urlencode(next_query)
+    return response if summary else sales
 
-    sale_ids = [s["id"] for s in sales]
-    # Fetch items joined with products
-    placeholders = ",".join(["%s"] * len(sale_ids))
-    items_sql = (
-        "SELECT si.*, p.name AS product_name, p.unit AS product_unit "
-        "FROM sale_items si JOIN products p ON p.id = si.product_id "
-        f"WHERE si.sale_id IN ({placeholders}) ORDER BY si.sale_id, si.id"
+@router.get("/stream")
+def stream_sales(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    payment_status: Optional[PaymentStatus] = None,
+    customer_name: Optional[str] = None,
+    limit: int = Query(STREAM_DEFAULT_ROWS, ge=1, le=STREAM_MAX_ROWS),
+):
+    """Stream matching sales with their items as NDJSON, one Sale per line, newest first.
+
+    Rows are read through a server-side cursor in batches and encoded as they
+    arrive, so memory stays flat. Each stream holds a pooled connection until
+    the client has read it all, so at most DB_STREAM_MAX_CONCURRENT run at once
+    (503 beyond that) and the row count is capped.
+    """
+    logger.info(
+        "GET /api/sales/stream | start=%s end=%s status=%s customer=%s limit=%s",
+        start_date,
+        end_date,
+        payment_status.value if payment_status else None,
+        customer_name,
+        limit,
     )
+    where, params = _sales_filters(start_date, end_date, payment_status, customer_name)
+    sql = f"SELECT {SALE_COLS} FROM sales"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY sale_date DESC, id DESC LIMIT %s"
+    params.append(limit)
+
+    if not _stream_slots.acquire(blocking=False):
+        raise ServiceUnavailableError("Too many sales streams in progress, please retry")
+    # The generator owns the slot from here and releases it when it finishes or is closed
+    lines = _stream_sale_lines(_with_items(sql), params)
+
+    # Run the query and take the first line here so a failure still becomes an error response
     try:
-        with pg_cursor() as cur:
-            cur.execute(items_sql, sale_ids)
-            items = _rows_to_dicts(cur)
+        first = next(lines, b"")
     except Exception as e:
-        logger.error("Failed to fetch sale items: %s", e)
-        raise DatabaseError("Failed to fetch sale items")
-
-    # Group items by sale_id
-    by_sale: Dict[int, List[Dict[str, Any]]] = {}
-    for it in items:
-        by_sale.setdefault(it["sale_id"], []).append(it)
+        logger.error("Failed to stream sales: %s", e)
+        raise DatabaseError("Failed to stream sales")
+    return StreamingResponse(chain((first,), lines), media_type="application/x-ndjson")
 
-    for s in sales:
-        s["items"] = by_sale.get(s["id"], [])
-    return sales
+def _stream_sale_lines(sql: str, params: List[Any]) -> Iterator[bytes]:
+    try:
+        with pg_cursor(dict_rows=True, name="sales_stream", itersize=STREAM_BATCH_ROWS) as cur:
+            cur.execute(sql, params)
+            for row in cur:
+                yield SALE_ADAPTER.dump_json(SALE_ADAPTER.validate_python(row)) + b"\n"
+    finally:
+        _stream_slots.release()
 
 @router.get("/{sale_id}", response_model=Sale)
-async def get_sale(sale_id: int):
+def get_sale(sale_id: int):
     """Get a specific sale by ID with items and product info."""
     logger.info("GET /api/sales/%s", sale_id)
     try:
-        with pg_cursor() as cur:
-            cur.execute("SELECT * FROM sales WHERE id = %s", (sale_id,))
-            sale_rows = _rows_to_dicts(cur)
-            if not sale_rows:
-                raise NotFoundError("Sale not found")
-            sale = sale_rows[0]
-
-        with pg_cursor() as cur:
-            cur.execute(
-                """
-                SELECT si.*, p.name AS product_name, p.unit AS product_unit
-                FROM sale_items si JOIN products p ON p.id = si.product_id
-                WHERE si.sale_id = %s ORDER BY si.id
-                """,
-                (sale_id,),
-            )
-            sale["items"] = _rows_to_dicts(cur)
+        with pg_cursor(dict_rows=True) as cur:
+            execute_prepared(cur, "sale_with_items", (sale_id,))
+            sale = cur.fetchone()
+        if not sale:
+            raise NotFoundError("Sale not found")
         return sale
     except NotFoundError:
         logger.error("Sale %s not found", sale_id)
@@ -121,54 +278,64 @@ async def get_sale(sale_id: int):
         raise DatabaseError("Failed to fetch sale")
 
 @router.post("/", response_model=Sale)
-async def create_sale(sale: SaleCreate, _: int = Depends(require_admin)):
+def create_sale(sale: SaleCreate, _: int = Depends(require_admin)):
     """Create a new sale with items and update product stock."""
     logger.info("POST /api/sales - creating sale for %s", sale.customer_name)
-    total_amount = sum(item.total_price for item in sale.items)
-    paid_amount = 0.0
     payment_status = PaymentStatus.PENDING.value
 
     try:
-        with pg_cursor(commit=True) as cur:
-            # Insert sale
+        with pg_cursor(commit=True, dict_rows=True) as cur:
+            # One round trip: the items arrive as parallel arrays, the total is summed in SQL,
+            # the sale, its items and the stock decrement are written by one statement, and
+            # the response is built from the RETURNING rows rather than read back
             cur.execute(
-            """
-            INSERT INTO sales (customer_name, customer_phone, customer_address, total_amount, paid_amount, payment_status, notes, sale_date)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-            """,
-            (
-                sale.customer_name,
-                sale.customer_phone,
-                sale.customer_address,
-                total_amount,
-                paid_amount,
-                payment_status,
-                sale.notes,
-                datetime.now(),
-            ),
+                f"""
+                WITH items AS (
+                    SELECT * FROM unnest(%(product_ids)s::int[], %(quantities)s::numeric[], %(unit_prices)s::numeric[], %(total_prices)s::numeric[])
+                        WITH ORDINALITY AS i(product_id, quantity, unit_price, total_price, ord)
+                ),
+                ins AS (
+                    INSERT INTO sales (customer_name, customer_phone, customer_address, total_amount, paid_amount, payment_status, notes, sale_date)
+                    SELECT %(customer_name)s, %(customer_phone)s, %(customer_address)s,
+                           (SELECT COALESCE(SUM(total_price), 0) FROM items), 0, %(payment_status)s, %(notes)s, %(sale_date)s
+                    RETURNING {SALE_COLS}
+                ),
+                ins_items AS (
+                    INSERT INTO sale_items (sale_id, product_id, quantity, unit_price, total_price)
+                    SELECT ins.id, i.product_id, i.quantity, i.unit_price, i.total_price
+                    FROM ins, items i ORDER BY i.ord
+                    RETURNING id, sale_id, product_id, quantity, unit_price, total_price
+                ),
+                -- Repeated products are summed so each stock row is updated once
+                stock AS (
+                    UPDATE products p SET stock_quantity = GREATEST(0, p.stock_quantity - v.qty)
+                    FROM (SELECT product_id, SUM(quantity) AS qty FROM items GROUP BY product_id) v
+                    WHERE p.id = v.product_id
+                )
+                SELECT ins.*, COALESCE((SELECT json_agg(ins_items ORDER BY ins_items.id) FROM ins_items), '[]') AS items
+                FROM ins
+                """,
+                {
+                    "product_ids": [i.product_id for i in sale.items],
+                    "quantities": [i.quantity for i in sale.items],
+                    "unit_prices": [i.unit_price for i in sale.items],
+                    "total_prices": [i.total_price for i in sale.items],
+                    "customer_name": sale.customer_name,
+                    "customer_phone": sale.customer_phone,
+                    "customer_address": sale.customer_address,
+                    "payment_status": payment_status,
+                    "notes": sale.notes,
+                    "sale_date": datetime.now(),
+                },
             )
-            row = cur.fetchone()
-            if not row:
+            created = cur.fetchone()
+            if not created:
                 raise BadRequestError("Failed to create sale")
-            (sale_id,) = row
-
-            # Insert items and update stock
-            for item in sale.items:
-                cur.execute(
-                """
-                INSERT INTO sale_items (sale_id, product_id, quantity, unit_price, total_price)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (sale_id, item.product_id, item.quantity, item.unit_price, item.total_price),
-                )
-                # Decrement stock
-                cur.execute(
-                "UPDATE products SET stock_quantity = GREATEST(0, stock_quantity - %s) WHERE id = %s",
-                (item.quantity, item.product_id),
-                )
+            sale_id = created["id"]
+        product_cache.invalidate_many({i.product_id for i in sale.items})
+        invalidate_sales_caches()
         logger.info("Sale %s created successfully", sale_id)
-        return await get_sale(sale_id)
+        return created
     except BadRequestError:
         logger.error("Failed to create sale - bad request")
         raise
@@ -177,12 +344,12 @@ async def create_sale(sale: SaleCreate, _: int = Depends(require_admin)):
         raise DatabaseError("Failed to create sale")
 
 @router.put("/{sale_id}/payment")
-async def update_payment(sale_id: int, paid_amount: float = Query(...), _: int = Depends(require_admin)):
+def update_payment(sale_id: int, paid_amount: float = Query(...), _: int = Depends(require_admin)):
     """Update payment for a sale"""
     logger.info("PUT /api/sales/%s/payment | paid_amount=%s", sale_id, paid_amount)
     try:
         with pg_cursor(commit=True) as cur:
-            cur.execute("SELECT total_amount, paid_amount FROM sales WHERE id = %s", (sale_id,))
+            execute_prepared(cur, "sale_payment_state", (sale_id,))
             row = cur.fetchone()
             if not row:
                 raise NotFoundError("Sale not found")
@@ -197,11 +364,9 @@ async def update_payment(sale_id: int, paid_amount: float = Query(...), _: int =
             else:
                 status_val = PaymentStatus.PENDING.value
 
-            cur.execute(
-                "UPDATE sales SET paid_amount = %s, payment_status = %s WHERE id = %s",
-                (new_paid, status_val, sale_id),
-            )
+            execute_prepared(cur, "update_sale_payment", (new_paid, status_val, sale_id))
 
+        invalidate_sales_caches()
         logger.info("Payment updated for sale %s | paid=%s/%s", sale_id, new_paid, total_amount)
         return {"message": f"Payment updated. Paid: {new_paid}/{total_amount}"}
     except NotFoundError:
@@ -212,26 +377,33 @@ async def update_payment(sale_id: int, paid_amount: float = Query(...), _: int =
         raise DatabaseError("Failed to update sale payment")
 
 @router.delete("/{sale_id}")
-async def delete_sale(sale_id: int, _: int = Depends(require_admin)):
+def delete_sale(sale_id: int, _: int = Depends(require_admin)):
     """Delete a sale and restore stock"""
     logger.info("DELETE /api/sales/%s", sale_id)
     try:
         with pg_cursor(commit=True) as cur:
-            # Fetch items
-            cur.execute("SELECT product_id, quantity FROM sale_items WHERE sale_id = %s", (sale_id,))
-            items = cur.fetchall()
-            # Restore stock
-            for product_id, qty in items:
-                cur.execute(
-                    "UPDATE products SET stock_quantity = stock_quantity + %s WHERE id = %s",
-                    (qty, product_id),
+            # Delete the items, restore their stock and delete the sale in one statement
+            cur.execute(
+                """
+                WITH deleted_items AS (
+                    DELETE FROM sale_items WHERE sale_id = %(id)s RETURNING product_id, quantity
+                ), restored AS (
+                    UPDATE products p SET stock_quantity = p.stock_quantity + d.qty
+                    FROM (SELECT product_id, SUM(quantity) AS qty FROM deleted_items GROUP BY product_id) d
+                    WHERE p.id = d.product_id
+                    RETURNING p.id
+                ), deleted_sale AS (
+                    DELETE FROM sales WHERE id = %(id)s RETURNING id
                 )
-            # Delete sale items then sale
-            cur.execute("DELETE FROM sale_items WHERE sale_id = %s", (sale_id,))
-            cur.execute("DELETE FROM sales WHERE id = %s RETURNING id", (sale_id,))
-            deleted = cur.fetchone()
+                SELECT EXISTS (SELECT 1 FROM deleted_sale), ARRAY(SELECT id FROM restored)
+                """,
+                {"id": sale_id},
+            )
+            deleted, product_ids = cur.fetchone()
             if not deleted:
                 raise NotFoundError("Sale not found")
+        product_cache.invalidate_many(product_ids)
+        invalidate_sales_caches()
         logger.info("Sale %s deleted", sale_id)
         return {"message": "Sale deleted successfully"}
     except NotFoundError:
@@ -242,31 +414,30 @@ async def delete_sale(sale_id: int, _: int = Depends(require_admin)):
         raise DatabaseError("Failed to delete sale")
 
 @router.get("/stats/daily")
-async def get_daily_sales_stats(date_filter: Optional[date] = None):
+def get_daily_sales_stats(date_filter: Optional[date] = None):
     """Get daily sales statistics"""
     if not date_filter:
         date_filter = date.today()
     next_day = date_filter + timedelta(days=1)
     logger.info("GET /api/sales/stats/daily | date=%s", date_filter)
+    stats_cache = sales_stats_today_cache if date_filter >= date.today() else sales_stats_history_cache
+    cached = stats_cache.get(date_filter)
+    if cached is not None:
+        return cached
     try:
         with pg_cursor() as cur:
-            cur.execute(
-                "SELECT total_amount, payment_status FROM sales WHERE sale_date >= %s AND sale_date < %s",
-                (date_filter, next_day),
-            )
-            rows = cur.fetchall()
-
-        total_sales = sum(r[0] for r in rows)
-        paid_sales = sum(r[0] for r in rows if r[1] == PaymentStatus.PAID.value)
-        pending_sales = sum(r[0] for r in rows if r[1] in (PaymentStatus.PENDING.value, PaymentStatus.PARTIAL.value))
+            execute_prepared(cur, "sales_daily_stats", (date_filter, next_day))
+            total_sales, paid_sales, pending_sales, total_transactions = cur.fetchone()
 
-        return {
+        payload = {
             "date": date_filter,
             "total_sales": total_sales,
             "paid_sales": paid_sales,
             "pending_sales": pending_sales,
-            "total_transactions": len(rows),
+            "total_transactions": total_transactions,
         }
+        stats_cache.set(date_filter, payload)
+        return payload
     except Exception as e:
         logger.error("Failed to compute daily sales stats: %s", e)
         raise DatabaseError("Failed to compute daily sales stats")
@@ -0,0 +1,57 @@
+from threading import Lock
+from typing import Any, Hashable, Iterable, Optional
+from cachetools import TTLCache
+
+
+class TTLStore:
+    """Thread-safe in-process TTL cache for hot, rarely-changing reads.
+
+    Entries are per worker process; writers invalidate explicitly after their
+    transaction commits, and the TTL bounds staleness across workers.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            return self._cache.get(key)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._cache[key] = value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def invalidate_many(self, keys: Iterable[Hashable]) -> None:
+        self.invalidate(*keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+# Product rows keyed by id; stock changes from sales/purchases invalidate them too
+product_cache = TTLStore(maxsize=1024, ttl=300)
+
+# Single-entry cache for the debts summary aggregate
+debt_summary_cache = TTLStore(maxsize=1, ttl=60)
+DEBT_SUMMARY_KEY = "debts:summary"
+
+# Daily sales stats keyed by date: today's figures move quickly, past days only change on edits
+sales_stats_today_cache = TTLStore(maxsize=4, ttl=15)
+sales_stats_history_cache = TTLStore(maxsize=512, ttl=3600)
+
+# Unfiltered sales listing pages keyed by (skip, limit)
+sales_list_cache = TTLStore(maxsize=64, ttl=30)
+
+
+def invalidate_sales_caches() -> None:
+    """Drop every cached sales read; called after any sale write commits."""
+    sales_stats_today_cache.clear()
+    sales_stats_history_cache.clear()
+    sales_list_cache.clear()
@@ -10,11 +10,27 @@ class Settings(BaseSettings):
     
     # Database configuration
     database_url: str = os.getenv("DATABASE_URL", "")
+    db_pool_min_size: int = int(os.getenv("DB_POOL_MIN_SIZE", "4"))
+    db_pool_max_size: int = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+    # Seconds a request waits for a free pooled connection before failing with 503
+    db_pool_timeout_seconds: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "5"))
+    # Reopen pooled connections older than this many seconds (0 disables recycling)
+    db_pool_recycle_seconds: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    # Streaming endpoints hold a pooled connection for the whole download; cap how many run at once
+    db_stream_max_concurrent: int = int(os.getenv("DB_STREAM_MAX_CONCURRENT", "2"))
+    # Named PREPARE/EXECUTE for hot queries; only enable on a direct or session-mode
+    # connection (not Supabase's transaction pooler on :6543)
+    db_prepare_statements: bool = os.getenv("DB_PREPARE_STATEMENTS", "false").lower() == "true"
+    # Statements slower than this many milliseconds are logged as warnings (0 disables)
+    slow_query_ms: float = float(os.getenv("SLOW_QUERY_MS", "200"))
     
     # Security
     secret_key: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     algorithm: str = os.getenv("ALGORITHM", "HS256")
     access_token_expire_minutes: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+
+    # Dashboard totals materialized view refresh interval (0 disables the background refresh)
+    dashboard_refresh_seconds: int = int(os.getenv("DASHBOARD_REFRESH_SECONDS", "30"))
     
     # API configuration
     api_v1_str: str = "/api/v1"
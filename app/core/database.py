@@ -1,12 +1,172 @@
 from app.core.config import settings
 
 # Postgres (psycopg2) imports
-from typing import Optional
+import re
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Set, Tuple
 from contextlib import contextmanager
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2.pool import ThreadedConnectionPool
+from app.core.exceptions import ServiceUnavailableError
+from app.core.logging import logger
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 
-_pg_pool: Optional[SimpleConnectionPool] = None
+_pg_pool: Optional[ThreadedConnectionPool] = None
+# One slot per pooled connection: getconn() raises instead of waiting when the
+# pool is exhausted, so callers queue here with a bounded wait first.
+_pg_pool_slots: Optional[threading.BoundedSemaphore] = None
+
+
+class PgConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which named statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: Set[str] = set()
+        self.created_at = time.monotonic()
+        self.cursor_factory = TimedCursor
+
+
+def _log_if_slow(started: float, query) -> None:
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms >= settings.slow_query_ms > 0:
+        # Log the statement text only; bound parameters may hold credentials
+        logger.warning("slow sql %.1fms: %s", elapsed_ms, " ".join(str(query).split())[:500])
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Default cursor; logs statements that run longer than settings.slow_query_ms."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _log_if_slow(started, query)
+
+    def executemany(self, query, vars):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars)
+        finally:
+            _log_if_slow(started, query)
+
+
+class DictRowCursor(TimedCursor):
+    """Cursor returning plain dicts keyed by column name.
+
+    Rows are fetched as tuples by the C cursor and zipped against a column
+    tuple taken from description once per result set, instead of going through
+    RealDictRow's per-column __setitem__ hook. Modelled on NamedTupleCursor.
+    """
+
+    columns: Optional[Tuple[str, ...]] = None
+
+    def execute(self, query, vars=None):
+        self.columns = None
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars):
+        self.columns = None
+        return super().executemany(query, vars)
+
+    def _columns(self) -> Tuple[str, ...]:
+        # Named cursors only have a description after their first fetch
+        if self.columns is None:
+            self.columns = tuple(d[0] for d in self.description) if self.description else ()
+        return self.columns
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            return dict(zip(self._columns(), row))
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size)
+        cols = self._columns()
+        return [dict(zip(cols, r)) for r in rows]
+
+    def fetchall(self):
+        rows = super().fetchall()
+        cols = self._columns()
+        return [dict(zip(cols, r)) for r in rows]
+
+    def __iter__(self):
+        try:
+            it = super().__iter__()
+            row = next(it)
+            cols = self._columns()
+            yield dict(zip(cols, row))
+            while True:
+                yield dict(zip(cols, next(it)))
+        except StopIteration:
+            return
+
+
+# Hot queries that are prepared once per connection and then run with EXECUTE,
+# skipping the parse/plan step on every call.
+PREPARED_STATEMENTS: Dict[str, str] = {
+    "user_by_username": "SELECT id, username, hashed_password, role, is_active FROM users WHERE username = %s",
+    "user_by_id": "SELECT id, username, email, full_name, role, is_active FROM users WHERE id = %s",
+    "refresh_by_jti": "SELECT user_id, revoked, expires_at < now() AS expired FROM refresh_tokens WHERE jti = %s",
+    "revoke_refresh": "UPDATE refresh_tokens SET revoked = true WHERE jti = %s",
+    "insert_refresh": (
+        "INSERT INTO refresh_tokens (user_id, jti, revoked, expires_at) "
+        "VALUES (%s, %s, false, now() + make_interval(days => %s))"
+    ),
+    "rotate_refresh": (
+        "WITH revoked AS ("
+        "UPDATE refresh_tokens SET revoked = true WHERE jti = %s AND revoked = false RETURNING user_id"
+        ") INSERT INTO refresh_tokens (user_id, jti, revoked, expires_at) "
+        "SELECT user_id, %s, false, now() + make_interval(days => %s) FROM revoked"
+    ),
+    "any_user_exists": "SELECT EXISTS (SELECT 1 FROM users) AS has_users",
+    "debt_by_id": (
+        "SELECT id, customer_name, customer_phone, amount, description, due_date, status, created_at, updated_at "
+        "FROM debts WHERE id = %s"
+    ),
+    "product_by_id": (
+        "SELECT id, name, type, brand, unit, price_per_unit, stock_quantity, minimum_stock, description, created_at, updated_at "
+        "FROM products WHERE id = %s"
+    ),
+    "purchase_with_items": (
+        "SELECT p.id, p.supplier_name, p.supplier_phone, p.supplier_address, p.total_amount, p.paid_amount, "
+        "p.payment_status, p.notes, p.purchase_date, p.created_at, p.updated_at, "
+        "COALESCE(json_agg(json_build_object("
+        "'id', pi.id, 'purchase_id', pi.purchase_id, 'product_id', pi.product_id, "
+        "'quantity', pi.quantity, 'unit_price', pi.unit_price, 'total_price', pi.total_price, "
+        "'product_name', pr.name, 'product_unit', pr.unit"
+        ") ORDER BY pi.id) FILTER (WHERE pi.id IS NOT NULL), '[]') AS items "
+        "FROM purchases p "
+        "LEFT JOIN purchase_items pi ON pi.purchase_id = p.id "
+        "LEFT JOIN products pr ON pr.id = pi.product_id "
+        "WHERE p.id = %s GROUP BY p.id"
+    ),
+    "sale_with_items": (
+        "SELECT s.id, s.customer_name, s.customer_phone, s.customer_address, s.total_amount, s.paid_amount, "
+        "s.payment_status, s.notes, s.sale_date, s.created_at, s.updated_at, "
+        "COALESCE(json_agg(json_build_object("
+        "'id', si.id, 'sale_id', si.sale_id, 'product_id', si.product_id, "
+        "'quantity', si.quantity, 'unit_price', si.unit_price, 'total_price', si.total_price, "
+        "'product_name', pr.name, 'product_unit', pr.unit"
+        ") ORDER BY si.id) FILTER (WHERE si.id IS NOT NULL), '[]') AS items "
+        "FROM sales s "
+        "LEFT JOIN sale_items si ON si.sale_id = s.id "
+        "LEFT JOIN products pr ON pr.id = si.product_id "
+        "WHERE s.id = %s GROUP BY s.id"
+    ),
+    "sale_payment_state": "SELECT total_amount, paid_amount FROM sales WHERE id = %s",
+    "update_sale_payment": "UPDATE sales SET paid_amount = %s, payment_status = %s WHERE id = %s",
+    "sales_daily_stats": (
+        "SELECT COALESCE(SUM(total_amount), 0), "
+        "COALESCE(SUM(total_amount) FILTER (WHERE payment_status = 'paid'), 0), "
+        "COALESCE(SUM(total_amount) FILTER (WHERE payment_status IN ('pending', 'partial')), 0), "
+        "COUNT(*) "
+        "FROM sales WHERE sale_date >= %s AND sale_date < %s"
+    ),
+}
 
 
 # ==============================
@@ -24,37 +184,143 @@ def _build_conninfo(url: str) -> str:
     return f"{url}{joiner}sslmode=require"
 
 
-def get_pg_pool(minconn: int = 1, maxconn: int = 5) -> SimpleConnectionPool:
-    """Lazily initialize and return a global psycopg2 connection pool."""
-    global _pg_pool
+def get_pg_pool(minconn: Optional[int] = None, maxconn: Optional[int] = None) -> ThreadedConnectionPool:
+    """Lazily initialize and return a global psycopg2 connection pool.
+
+    The pool is thread-safe because sync endpoints run on FastAPI's threadpool.
+    """
+    global _pg_pool, _pg_pool_slots
     if _pg_pool is None:
         conninfo = _build_conninfo(settings.database_url)
-        _pg_pool = SimpleConnectionPool(minconn=minconn, maxconn=maxconn, dsn=conninfo)
+        maxconn = maxconn if maxconn is not None else settings.db_pool_max_size
+        _pg_pool = ThreadedConnectionPool(
+            minconn=minconn if minconn is not None else settings.db_pool_min_size,
+            maxconn=maxconn,
+            dsn=conninfo,
+            connection_factory=PgConnection,
+        )
+        _pg_pool_slots = threading.BoundedSemaphore(maxconn)
     return _pg_pool
 
 
+def close_pg_pool() -> None:
+    """Close every pooled connection; called on application shutdown."""
+    global _pg_pool, _pg_pool_slots
+    if _pg_pool is not None:
+        _pg_pool.closeall()
+        _pg_pool = None
+        _pg_pool_slots = None
+
+
+def _is_stale(conn) -> bool:
+    """A pooled connection is unusable once closed or older than the recycle age."""
+    if conn.closed:
+        return True
+    recycle = settings.db_pool_recycle_seconds
+    created_at = getattr(conn, "created_at", None)
+    return recycle > 0 and created_at is not None and time.monotonic() - created_at > recycle
+
+
 @contextmanager
 def pg_connection():
-    """Context manager that yields a pooled psycopg2 connection."""
+    """Context manager that yields a pooled psycopg2 connection.
+
+    Waits up to DB_POOL_TIMEOUT_SECONDS for a free connection and raises
+    ServiceUnavailableError (503) rather than failing or blocking forever.
+    Closed or over-age connections are discarded at checkout, and a connection
+    whose socket broke while in use is closed instead of returned to the pool.
+    """
     pool = get_pg_pool()
-    conn = pool.getconn()
+    slots = _pg_pool_slots
+    if not slots.acquire(timeout=settings.db_pool_timeout_seconds):
+        raise ServiceUnavailableError("Database is busy, please retry")
     try:
-        yield conn
+        conn = pool.getconn()
+        while _is_stale(conn):
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
     finally:
-        pool.putconn(conn)
+        slots.release()
 
 
 @contextmanager
-def pg_cursor(commit: bool = False):
+def pg_cursor(commit: bool = False, dict_rows: bool = False, name: Optional[str] = None, itersize: int = 2000):
     """Context manager for a psycopg2 cursor. Optionally commits on exit.
 
+    With dict_rows=True rows are fetched as dicts keyed by column name.
+    Passing a name opens a server-side cursor; iterating it streams rows
+    from the server in batches of itersize instead of buffering them all.
+
     Usage:
         with pg_cursor(commit=True) as cur:
             cur.execute("SELECT 1")
     """
+    cursor_factory = DictRowCursor if dict_rows else None
     with pg_connection() as conn:
-        with conn.cursor() as cur:
+        with conn.cursor(name=name, cursor_factory=cursor_factory) as cur:
+            if name is not None:
+                cur.itersize = itersize
             yield cur
             if commit:
                 conn.commit()
 
+
+# Rows per round trip for server-side cursors that stream a response (e.g. /sales/stream)
+STREAM_BATCH_ROWS = 200
+
+
+def ilike_contains(term: str) -> str:
+    """ILIKE pattern matching term as a literal substring.
+
+    User-typed % and _ are escaped so a search like "%" or "_" cannot widen
+    into a match-everything scan that bypasses the trigram indexes.
+    """
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _numbered_placeholders(sql: str) -> str:
+    """Rewrite psycopg2 %s placeholders into PostgreSQL $1, $2, ... parameters."""
+    counter = iter(range(1, sql.count("%s") + 1))
+    return re.sub(r"%s", lambda _: f"${next(counter)}", sql)
+
+
+# Set once the server rejects a prepared statement (e.g. a transaction-mode pooler
+# handed us a different backend); from then on every call runs the plain SQL.
+_prepare_unsupported = False
+
+
+def execute_prepared(cur, name: str, params: Sequence[Any] = ()) -> None:
+    """Execute a statement from PREPARED_STATEMENTS, preparing it on first use per connection.
+
+    The named statement is only used as the first statement of a transaction, so
+    if the server does not know it (or already has it) the transaction can be
+    rolled back and the plain SQL run instead without losing earlier work.
+    """
+    global _prepare_unsupported
+    sql = PREPARED_STATEMENTS[name]
+    conn = cur.connection
+    if (
+        settings.db_prepare_statements
+        and not _prepare_unsupported
+        and isinstance(conn, PgConnection)
+        and conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    ):
+        try:
+            if name not in conn.prepared:
+                cur.execute(f"PREPARE {name} AS {_numbered_placeholders(sql)}")
+                conn.prepared.add(name)
+            if params:
+                cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+            else:
+                cur.execute(f"EXECUTE {name}")
+            return
+        except (psycopg2.errors.DuplicatePreparedStatement, psycopg2.errors.InvalidSqlStatementName) as e:
+            conn.rollback()
+            _prepare_unsupported = True
+            logger.warning("Prepared statements unavailable, falling back to plain queries: %s", e)
+    cur.execute(sql, params)
@@ -1,5 +1,5 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from typing import Any, Dict
 from app.core.logging import logger
 
@@ -30,19 +30,27 @@ class DatabaseError(AppError):
     status_code = 500
 
 
+class ServiceUnavailableError(AppError):
+    status_code = 503
+
+
 def register_exception_handlers(app: FastAPI):
     @app.exception_handler(AppError)
     async def app_error_handler(request: Request, exc: AppError):
+        # Routers wrap unexpected errors in DatabaseError; pool exhaustion should still read as 503
+        if isinstance(exc.__context__, ServiceUnavailableError):
+            exc = exc.__context__
         # Log structured app errors at warning level
         logger.warning(
-            "AppError | type=%s status=%s path=%s message=%s extra=%s",
+            "AppError | type=%s status=%s path=%s user=%s message=%s extra=%s",
             exc.__class__.__name__,
             getattr(exc, "status_code", 500),
             request.url.path,
+            getattr(request.state, "user", None),
             exc.message,
             getattr(exc, "extra", {}),
         )
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=exc.status_code,
             content={
                 "error": {
@@ -58,7 +66,7 @@ def register_exception_handlers(app: FastAPI):
     async def unhandled_exception_handler(request: Request, exc: Exception):
         # Log full traceback for unexpected errors
         logger.exception("Unhandled exception at %s: %s", request.url.path, exc)
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "error": {
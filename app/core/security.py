@@ -1,7 +1,15 @@
+import hashlib
+import hmac
+import time
 from datetime import datetime, timedelta, timezone
+from threading import Lock
 from typing import Optional, Tuple
-from jose import jwt, JWTError
-from fastapi import Depends, HTTPException, status
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from cachetools import TTLCache
+import jwt
+from jwt import InvalidTokenError
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from app.core.config import settings
 from app.core.database import pg_cursor
@@ -9,21 +17,45 @@ from pydantic import BaseModel
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+REFRESH_TOKEN_EXPIRE_DAYS = 14
+
 class TokenData(BaseModel):
     sub: str
     role: str
     jti: Optional[str] = None
+    exp: Optional[int] = None
+
+# Decoded identities keyed by a digest of the bearer token (raw tokens are never stored).
+# Values are (user_id, role, jti, exp); entries never outlive the token's own expiry.
+_identity_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_identity_cache_lock = Lock()
 
 # Password hashing
 
+# Argon2id: 64 MiB per hash keeps GPU cracking expensive at ~bcrypt-level login latency
+_password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+ARGON2_PREFIX = "$argon2"
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    # Plain text comparison as requested (no hashing)
-    return plain_password == hashed_password
+    if hashed_password.startswith(ARGON2_PREFIX):
+        try:
+            return _password_hasher.verify(hashed_password, plain_password)
+        except (VerificationError, InvalidHashError):
+            return False
+    # Legacy rows stored before hashing was enabled; rehashed on next login
+    return hmac.compare_digest(plain_password.encode(), hashed_password.encode())
 
 
 def get_password_hash(password: str) -> str:
-    # Return password as-is (no hashing)
-    return password
+    return _password_hasher.hash(password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True for legacy (non-Argon2) hashes or Argon2 hashes with outdated parameters."""
+    if not hashed_password.startswith(ARGON2_PREFIX):
+        return True
+    return _password_hasher.check_needs_rehash(hashed_password)
 
 
 # JWT helpers
@@ -31,15 +63,20 @@ def get_password_hash(password: str) -> str:
 def create_access_token(subject: str, role: str, expires_minutes: int = settings.access_token_expire_minutes, jti: Optional[str] = None) -> str:
     now = datetime.now(timezone.utc)
     expire = now + timedelta(minutes=expires_minutes)
-    payload = {"sub": subject, "role": role, "exp": expire, "iat": now, "jti": jti}
+    payload = {"sub": subject, "role": role, "exp": expire, "iat": now}
+    # PyJWT rejects a null jti on decode, so only include it when set
+    if jti is not None:
+        payload["jti"] = jti
     token = jwt.encode(payload, settings.secret_key, algorithm=settings.algorithm)
     return token
 
 
-def create_refresh_token(subject: str, role: str, expires_days: int = 14, jti: Optional[str] = None) -> str:
+def create_refresh_token(subject: str, role: str, expires_days: int = REFRESH_TOKEN_EXPIRE_DAYS, jti: Optional[str] = None) -> str:
     now = datetime.now(timezone.utc)
     expire = now + timedelta(days=expires_days)
-    payload = {"sub": subject, "role": role, "exp": expire, "iat": now, "jti": jti, "type": "refresh"}
+    payload = {"sub": subject, "role": role, "exp": expire, "iat": now, "type": "refresh"}
+    if jti is not None:
+        payload["jti"] = jti
     token = jwt.encode(payload, settings.secret_key, algorithm=settings.algorithm)
     return token
 
@@ -47,27 +84,57 @@ def create_refresh_token(subject: str, role: str, expires_days: int = 14, jti: O
 def decode_token(token: str) -> TokenData:
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        return TokenData(sub=payload.get("sub"), role=payload.get("role"), jti=payload.get("jti"))
-    except JWTError:
+        return TokenData(sub=payload.get("sub"), role=payload.get("role"), jti=payload.get("jti"), exp=payload.get("exp"))
+    except InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
 
 
 # Dependencies
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> Tuple[int, str]:
-    """Extract user from JWT token."""
+def _token_cache_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def invalidate_cached_identity(jti: str) -> None:
+    """Drop cached identities issued under the given jti (e.g. on logout)."""
+    with _identity_cache_lock:
+        stale = [k for k, v in _identity_cache.items() if v[2] == jti]
+        for k in stale:
+            _identity_cache.pop(k, None)
+
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)) -> Tuple[int, str]:
+    """Extract user from JWT token.
+
+    Declared async because it never blocks (a cache lookup and an HMAC check),
+    so it runs on the event loop instead of costing a threadpool hop per request.
+    The identity is also left on request.state.user so code outside dependency
+    injection (e.g. exception handlers) can read it without decoding again.
+    """
+    key = _token_cache_key(token)
+    with _identity_cache_lock:
+        cached = _identity_cache.get(key)
+    if cached is not None:
+        user_id, role, _, exp = cached
+        if exp is None or exp > time.time():
+            request.state.user = (user_id, role)
+            return user_id, role
     try:
         td = decode_token(token)
-        return int(td.sub), td.role
-    except (JWTError, ValueError):
+        identity = (int(td.sub), td.role)
+    except (InvalidTokenError, ValueError, TypeError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    with _identity_cache_lock:
+        _identity_cache[key] = (identity[0], identity[1], td.jti, td.exp)
+    request.state.user = identity
+    return identity
 
 
-def require_admin(identity: Tuple[int, str] = Depends(get_current_user)) -> int:
+async def require_admin(identity: Tuple[int, str] = Depends(get_current_user)) -> int:
     """Require admin role."""
     user_id, role = identity
     if role != "admin":
@@ -1,14 +1,56 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+import anyio.to_thread
+import psycopg2.errors
+from fastapi import FastAPI, Depends
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import products, sales, purchases, debts, dashboard, auth, admin
 from app.core.config import settings
+from app.core.database import get_pg_pool, close_pg_pool, pg_cursor
 from app.core.logging import logger
-from app.core.exceptions import register_exception_handlers
+from app.core.exceptions import register_exception_handlers, DatabaseError
+from app.core.security import require_admin
+
+async def _refresh_dashboard_totals_forever(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(dashboard.refresh_dashboard_totals)
+        except psycopg2.errors.UndefinedTable:
+            # Schema without the materialized view: the stats endpoint computes totals live
+            logger.warning("dashboard_totals view not found; stopping the background refresh")
+            return
+        except Exception as e:
+            logger.error("Failed to refresh dashboard totals: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the connection pool up front so the first requests don't pay connection setup
+    try:
+        get_pg_pool()
+        logger.info("Postgres connection pool ready")
+    except Exception as e:
+        logger.error("Failed to open Postgres connection pool: %s", e)
+    # Sync endpoints run on anyio's worker threads; size them to what the DB pool can serve
+    anyio.to_thread.current_default_thread_limiter().total_tokens = min(settings.db_pool_max_size * 2, 32)
+    refresher = None
+    if settings.dashboard_refresh_seconds > 0:
+        refresher = asyncio.create_task(_refresh_dashboard_totals_forever(settings.dashboard_refresh_seconds))
+    yield
+    if refresher is not None:
+        refresher.cancel()
+        with suppress(asyncio.CancelledError):
+            await refresher
+    close_pg_pool()
 
 app = FastAPI(
     title="Fertilizer Shop Dashboard API",
     description="API for managing fertilizer shop operations",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS middleware
@@ -22,6 +64,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Keyset paging cursor for GET /api/sales
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Register exception handlers
@@ -45,3 +89,22 @@ async def root():
 async def health_check():
     logger.info("Health check requested")
     return {"status": "healthy"}
+
+@app.get("/health/slow-queries")
+def slow_queries(_: int = Depends(require_admin)):
+    """Top statements by mean execution time from pg_stat_statements (admin only)."""
+    logger.info("Slow query report requested")
+    try:
+        with pg_cursor(dict_rows=True) as cur:
+            cur.execute(
+                """
+                SELECT query, calls, mean_exec_time, rows, shared_blks_read
+                FROM pg_stat_statements
+                ORDER BY mean_exec_time DESC
+                LIMIT 20
+                """
+            )
+            return cur.fetchall()
+    except Exception as e:
+        logger.error("Failed to read pg_stat_statements: %s", e)
+        raise DatabaseError("pg_stat_statements is not available")
@@ -74,6 +74,17 @@ class Sale(SaleBase):
     created_at: datetime
     updated_at: datetime
 
+class SaleSummary(BaseModel):
+    id: int
+    customer_name: str
+    customer_phone: Optional[str] = None
+    total_amount: float
+    paid_amount: float
+    payment_status: PaymentStatus
+    sale_date: datetime
+    created_at: datetime
+    updated_at: datetime
+
 class SaleCreate(BaseModel):
     customer_name: str
     customer_phone: Optional[str] = None
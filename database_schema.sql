@@ -120,16 +120,55 @@ CREATE TRIGGER update_debts_updated_at BEFORE UPDATE ON debts
 -- Indexes for better performance
 CREATE INDEX idx_products_type ON products(type);
 CREATE INDEX idx_products_stock ON products(stock_quantity);
-CREATE INDEX idx_sales_date ON sales(sale_date);
 CREATE INDEX idx_sales_customer ON sales(customer_name);
-CREATE INDEX idx_sales_status ON sales(payment_status);
-CREATE INDEX idx_purchases_date ON purchases(purchase_date);
 CREATE INDEX idx_purchases_supplier ON purchases(supplier_name);
-CREATE INDEX idx_purchases_status ON purchases(payment_status);
 CREATE INDEX idx_debts_customer ON debts(customer_name);
-CREATE INDEX idx_debts_status ON debts(status);
 CREATE INDEX idx_debts_due_date ON debts(due_date);
 
+-- Partial indexes for the dashboard aggregates (index-only scans once the tables are VACUUM ANALYZEd).
+-- On an existing database run these as CREATE INDEX CONCURRENTLY, outside a transaction block.
+CREATE INDEX IF NOT EXISTS sales_paid_amount_idx ON sales(total_amount) WHERE payment_status = 'paid';
+CREATE INDEX IF NOT EXISTS purchases_paid_amount_idx ON purchases(total_amount) WHERE payment_status = 'paid';
+CREATE INDEX IF NOT EXISTS debts_open_idx ON debts(created_at, amount) WHERE status IN ('pending','partial','overdue');
+-- Also serves GET /products/low-stock/ (stock_quantity < minimum_stock implies the <= predicate)
+CREATE INDEX IF NOT EXISTS products_low_stock_idx ON products(id) WHERE stock_quantity <= minimum_stock;
+-- Covering index so top-products aggregation is an index-only scan
+CREATE INDEX IF NOT EXISTS sale_items_product_qty_idx ON sale_items(product_id) INCLUDE (quantity);
+
+-- Indexes matching the list filters and sort orders of the debts/purchases/products endpoints
+CREATE INDEX IF NOT EXISTS idx_debts_created ON debts(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_debts_status_created ON debts(status, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_debts_due_open ON debts(due_date) WHERE status IN ('pending','partial');
+CREATE INDEX IF NOT EXISTS idx_purchases_date_id ON purchases(purchase_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_purchases_status_date ON purchases(payment_status, purchase_date DESC);
+CREATE INDEX IF NOT EXISTS idx_purchase_items_purchase ON purchase_items(purchase_id);
+-- Superseded by the composite indexes above
+DROP INDEX IF EXISTS idx_debts_status;
+DROP INDEX IF EXISTS idx_purchases_date;
+DROP INDEX IF EXISTS idx_purchases_status;
+-- Daily sales stats: range on sale_date, answered from the index alone
+CREATE INDEX IF NOT EXISTS idx_sales_date_status ON sales(sale_date, payment_status) INCLUDE (total_amount);
+-- Sales listing (newest first), open-balance filter and item lookups by sale
+CREATE INDEX IF NOT EXISTS idx_sales_date_id ON sales(sale_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_sales_unpaid ON sales(payment_status, sale_date DESC) WHERE payment_status <> 'paid';
+CREATE INDEX IF NOT EXISTS idx_sale_items_sale ON sale_items(sale_id);
+-- Superseded by idx_sales_date_status / idx_sales_date_id and idx_sales_unpaid (+ sales_paid_amount_idx)
+DROP INDEX IF EXISTS idx_sales_date;
+DROP INDEX IF EXISTS idx_sales_status;
+
+-- Trigram indexes so the substring (ILIKE '%x%') searches avoid full scans.
+-- name and brand are indexed separately so "name ILIKE .. OR brand ILIKE .." can BitmapOr them.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_sales_customer_trgm ON sales USING gin (customer_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_debts_customer_trgm ON debts USING gin (customer_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_purchases_supplier_trgm ON purchases USING gin (supplier_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_brand_trgm ON products USING gin (brand gin_trgm_ops);
+
+-- Per-statement timing for GET /health/slow-queries. Needs
+-- shared_preload_libraries = 'pg_stat_statements' (enabled by default on Supabase).
+CREATE EXTENSION IF NOT EXISTS pg_stat_statements;
+
 -- Sample data
 INSERT INTO products (name, type, brand, unit, price_per_unit, stock_quantity, minimum_stock, description) VALUES
 ('NPK 20-20-20', 'fertilizer', 'Yara', 'kg', 45.00, 500, 50, 'Balanced NPK fertilizer for all crops'),
@@ -176,6 +215,19 @@ INSERT INTO debts (customer_name, customer_phone, amount, description, due_date,
 ('Dinesh Yadav', '9876543214', 2500.00, 'Seeds and pesticide purchase', '2024-03-30', 'overdue'),
 ('Vikash Kumar', '9876543215', 1200.00, 'NPK fertilizer purchase', '2024-04-10', 'pending');
 
+-- Precomputed dashboard totals; the API refreshes this every DASHBOARD_REFRESH_SECONDS
+CREATE MATERIALIZED VIEW IF NOT EXISTS dashboard_totals AS
+SELECT
+    1 AS id,
+    (SELECT COALESCE(SUM(total_amount),0) FROM sales WHERE payment_status = 'paid') AS total_sales,
+    (SELECT COALESCE(SUM(total_amount),0) FROM purchases WHERE payment_status = 'paid') AS total_purchases,
+    (SELECT COUNT(*) FROM products) AS total_products,
+    (SELECT COUNT(*) FROM products WHERE stock_quantity <= minimum_stock) AS low_stock_products,
+    (SELECT COALESCE(SUM(amount),0) FROM debts WHERE status IN ('pending','partial','overdue')) AS total_debts;
+
+-- Required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS dashboard_totals_id_idx ON dashboard_totals(id);
+
 -- =========================
 -- Authentication & Sessions
 -- =========================
@@ -183,7 +235,8 @@ INSERT INTO debts (customer_name, customer_phone, amount, description, due_date,
 -- Users table
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
-    email VARCHAR(255) UNIQUE NOT NULL,
+    username VARCHAR(255) UNIQUE NOT NULL,
+    email VARCHAR(255) UNIQUE,
     hashed_password TEXT NOT NULL,
     full_name VARCHAR(255),
     role VARCHAR(20) NOT NULL DEFAULT 'user' CHECK (role IN ('user','admin')),
@@ -201,6 +254,12 @@ CREATE TABLE IF NOT EXISTS refresh_tokens (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
-CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+-- Uniqueness is enforced by the database; user creation relies on it via ON CONFLICT.
+-- Fresh databases get these from the inline UNIQUE constraints above; the statements
+-- only matter for older databases whose users table predates them.
+CREATE UNIQUE INDEX IF NOT EXISTS users_username_key ON users(username);
+CREATE UNIQUE INDEX IF NOT EXISTS users_email_key ON users(email);
+-- Duplicates the unique index on email
+DROP INDEX IF EXISTS idx_users_email;
 CREATE INDEX IF NOT EXISTS idx_users_active ON users(is_active);
 CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user ON refresh_tokens(user_id);